@@ -0,0 +1,6 @@
+"""
+Benchmarks for the interpreter, scheduler and circuit hot paths.
+
+    python -m benchmarks --save results.json
+    python -m benchmarks --baseline results.json --threshold 0.1
+"""
@@ -0,0 +1,34 @@
+import argparse
+import sys
+
+from benchmarks import run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('names', nargs='*', help="Workloads to run.")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiplies the cycles of every workload.")
+    parser.add_argument('--save', help="Write results to this JSON file.")
+    parser.add_argument('--baseline', help="JSON results to compare with.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Allowed fraction worse than the baseline.")
+    args = parser.parse_args(argv)
+    results = run.run(args.names, args.repeat, args.scale)
+    print(run.report(results))
+    if args.save:
+        run.save(results, args.save)
+    if args.baseline:
+        regressions = run.compare(
+            results, run.load(args.baseline), args.threshold)
+        for name, metric, old, new in regressions:
+            print("Regression: {} {} {:,.0f} -> {:,.0f}".format(
+                name, metric, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Times workloads and compares the results with a baseline.
+"""
+import json
+import platform
+import time
+import tracemalloc
+
+from benchmarks.workloads import WORKLOADS
+
+# Higher is better for rates, lower is better for memory.
+RATES = ('insts_per_sec', 'cycles_per_sec')
+SIZES = ('peak_bytes',)
+
+
+def measure(workload, repeat=3, scale=1.0):
+    """
+    Best of repeat runs of a workload:
+
+        {'seconds': s, 'cycles_per_sec': n, 'insts_per_sec': n,
+         'peak_bytes': n}
+
+    Peak memory is measured in a separate run, since tracing allocations
+    slows everything down.
+    """
+    cycles = max(1, int(workload.cycles * scale))
+    best = None
+    for n in range(repeat):
+        board = workload.build()
+        start = time.perf_counter()
+        ran, insts = board.run(cycles=cycles)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, ran, insts)
+    seconds, ran, insts = best
+    seconds = max(seconds, 1e-9)
+    tracemalloc.start()
+    try:
+        board = workload.build()
+        board.run(cycles=max(1, cycles // 10))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': seconds,
+        'cycles_per_sec': ran / seconds,
+        'insts_per_sec': insts / seconds,
+        'peak_bytes': peak,
+    }
+
+
+def run(names=None, repeat=3, scale=1.0):
+    """
+    Measures every workload, or only the named ones.
+    """
+    results = {}
+    for workload in WORKLOADS:
+        if names and workload.name not in names:
+            continue
+        results[workload.name] = measure(workload, repeat, scale)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Lists everything more than threshold worse than the baseline:
+
+        [(workload, metric, baseline value, new value)]
+    """
+    regressions = []
+    for name, new in results['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for metric in RATES:
+            if new[metric] < old[metric] * (1 - threshold):
+                regressions.append((name, metric, old[metric], new[metric]))
+        for metric in SIZES:
+            if new[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric], new[metric]))
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def report(results):
+    out = ["{:<12} {:>14} {:>14} {:>12}".format(
+        'workload', 'insts/sec', 'cycles/sec', 'peak bytes')]
+    for name, r in results['results'].items():
+        out.append("{:<12} {:>14,.0f} {:>14,.0f} {:>12,}".format(
+            name, r['insts_per_sec'], r['cycles_per_sec'], r['peak_bytes']))
+    return "\n".join(out)
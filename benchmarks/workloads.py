@@ -0,0 +1,143 @@
+"""
+Representative boards to time.
+
+Each workload builds a fresh Board, so runs don't affect each other.
+"""
+from mcx4.board import Board
+from mcx4.microcontrollers import MC4000, MC6000
+
+
+class Workload():
+
+    name = None
+    description = None
+    cycles = 0  # Cycles to run for.
+    _build = None  # Function returning a Board.
+
+    def __init__(self, name, description, cycles, build):
+        self.name = name
+        self.description = description
+        self.cycles = cycles
+        self._build = build
+
+    def build(self):
+        return self._build()
+
+
+def arithmetic():
+    board = Board()
+    mc = MC6000('mc')
+    board.add(mc)
+    mc.compile("""
+        loop: add 1
+              mul 3
+              sub dat
+              mov acc dat
+              jmp loop
+    """)
+    return board
+
+
+def digits():
+    board = Board()
+    mc = MC6000('mc')
+    board.add(mc)
+    mc.compile("""
+        add 7
+        mov acc dat
+        dgt 0
+        dst 2 dat
+        dgt 1
+        dst 1 dat
+        mov dat acc
+    """)
+    return board
+
+
+def branches():
+    board = Board()
+    mc = MC6000('mc')
+    board.add(mc)
+    mc.compile("""
+        add 13
+        tgt acc 500
+      + sub 600
+        teq acc 0
+      - tlt acc dat
+      + mov acc dat
+      - mov 0 null
+        tcp dat 100
+    """)
+    return board
+
+
+def sleepers():
+    board = Board()
+    for n in range(100):
+        mc = MC4000('mc{}'.format(n))
+        board.add(mc)
+        mc.compile("""
+            add 1
+            slp {}
+        """.format(1 + n % 7))
+    return board
+
+
+def fanout():
+    board = Board()
+    source = MC6000('source', gpio=1)
+    board.add(source)
+    source.compile("""
+        add 37
+        mov acc p0
+        dgt 0
+    """)
+    for n in range(64):
+        mc = MC4000('sink{}'.format(n))
+        board.add(mc)
+        mc.p0.link(source.p0)
+        mc.compile("""
+            mov p0 acc
+            teq acc 0
+          - mov acc p1
+        """)
+    return board
+
+
+def chain():
+    board = Board()
+    parts = []
+    for n in range(200):
+        mc = MC6000('mc{}'.format(n))
+        board.add(mc)
+        if parts:
+            mc.p0.link(parts[-1].p1)
+            if n % 2:
+                mc.x0.link(parts[-1].x1)
+        parts.append(mc)
+    for n, mc in enumerate(parts):
+        if n % 2:
+            mc.compile("""
+                mov p0 acc
+                add x0
+                mov acc p1
+            """)
+        else:
+            mc.compile("""
+                mov p0 acc
+                add 1
+                mov acc x1
+                mov acc p1
+            """)
+    return board
+
+
+WORKLOADS = [
+    Workload('arithmetic', "Tight add/mul/sub/jmp loop.", 200000, arithmetic),
+    Workload('digits', "dgt/dst heavy display code.", 200000, digits),
+    Workload('branches', "Tests and conditional instructions.", 200000,
+             branches),
+    Workload('sleepers', "100 parts mostly asleep.", 200000, sleepers),
+    Workload('fanout', "One GPIO driving 64 readers.", 5000, fanout),
+    Workload('chain', "200 parts linked by GPIO and XBus.", 2000, chain),
+]
@@ -0,0 +1,164 @@
+"""
+Runs many independent boards over a pool of worker processes.
+
+Worker processes are reused between boards, so every program is only
+compiled once per worker through the CPU program cache.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numbers
+import os
+
+from mcx4 import microcontrollers
+from mcx4.board import Board
+from mcx4.stimulus import Stimulus
+
+
+class BoardSpec():
+
+    """
+    Everything needed to build and run one board.
+
+        BoardSpec(
+            controllers={'a': ('MC4000', code_a), 'b': ('MC6000', code_b)},
+            links=[('a.p0', 'b.p1')],
+            cycles=1000,
+            inputs={'a.p1': [0, 0, 100]},  # Written before each cycle.
+            trace=['b.p1'],
+        )
+
+    Input values can be a single value or a sequence of values, one per
+    cycle.  The last value of a sequence is held.  They're driven onto
+    the port's circuit from outside, like another part linked to it, so
+    reading the port doesn't clear them.
+    """
+
+    controllers = None  # {name:(model, code)}
+    links = None  # [(port, port)]
+    cycles = 0
+    inputs = None  # {port:value or [value]}
+    trace = None  # [port]
+
+    def __init__(self, controllers, links=(), cycles=0, inputs=None,
+                 trace=()):
+        self.controllers = dict(controllers)
+        self.links = list(links)
+        self.cycles = cycles
+        self.inputs = dict(inputs or {})
+        self.trace = list(trace)
+
+
+class BoardResult():
+
+    """
+    Compact outcome of one board run.
+
+    Traces only hold the cycles where a port's output changed:
+
+        {'b.p1': [(0, 0), (12, 100), (40, 0)]}
+    """
+
+    registers = None  # {controller:{register:value}}
+    traces = None  # {port:[(cycle, value)]}
+    cycles = 0
+    instructions = 0
+
+    def __init__(self, registers, traces, cycles, instructions):
+        self.registers = registers
+        self.traces = traces
+        self.cycles = cycles
+        self.instructions = instructions
+
+    def __repr__(self):
+        return "<BoardResult cycles={} instructions={}>".format(
+            self.cycles, self.instructions)
+
+
+def build(spec):
+    """
+    Builds a Board from a BoardSpec.
+
+    Returns (board, {name:Microcontroller}).
+    """
+    board = Board()
+    mcs = {}
+    for name, (model, code) in spec.controllers.items():
+        cls = getattr(microcontrollers, model, None)
+        if not (isinstance(cls, type)
+                and issubclass(cls, microcontrollers.Microcontroller)):
+            raise ValueError("Unknown model: {}".format(model))
+        mc = cls(name)
+        board.add(mc)
+        mc.compile(code)
+        mcs[name] = mc
+    for a, b in spec.links:
+        port(mcs, a).link(port(mcs, b))
+    return board, mcs
+
+
+def port(mcs, name):
+    """
+    Looks up a port by its 'controller.port' name.
+    """
+    mc, _, p = name.partition('.')
+    if mc not in mcs:
+        raise ValueError("Unknown controller: {}".format(mc))
+    return mcs[mc].get_port(p)
+
+
+def run(spec):
+    """
+    Builds and runs a single BoardSpec, returning a BoardResult.
+    """
+    board, mcs = build(spec)
+    for name, values in spec.inputs.items():
+        if isinstance(values, numbers.Integral):
+            values = [values]
+        stim = Stimulus(board, values, name=name)
+        stim.link(port(mcs, name))
+        stim.start()
+    traced = [(p, port(mcs, p)) for p in spec.trace]
+    if not traced:
+        cycles, insts = board.run(cycles=spec.cycles)
+        return BoardResult(registers(mcs), {}, cycles, insts)
+    traces = {name: [] for name, p in traced}
+    last = {name: None for name, p in traced}
+    insts = board.executed()
+    for cycle in range(spec.cycles):
+        board.run(cycles=1)
+        for name, p in traced:
+            out = p.output
+            if out != last[name]:
+                last[name] = out
+                traces[name].append((cycle, out))
+    insts = board.executed() - insts
+    return BoardResult(registers(mcs), traces, spec.cycles, insts)
+
+
+def registers(mcs):
+    """
+    Final register values of every controller.
+    """
+    out = {}
+    for name, mc in mcs.items():
+        out[name] = {
+            r: reg.read() for r, reg in mc.registers.items()
+            if r not in ('null', 'dat')
+        }
+    return out
+
+
+def simulate(specs, workers=None, chunksize=None):
+    """
+    Runs a list of BoardSpecs across worker processes.
+
+    Results come back in the same order as the specs.
+    """
+    specs = list(specs)
+    if not specs:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # A few chunks per worker keeps them busy without much overhead.
+        chunksize = max(1, len(specs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, specs, chunksize=chunksize))
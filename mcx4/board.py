@@ -1,46 +1,489 @@
+from collections import namedtuple
+from heapq import heapify, heappush, heappop
+
 from mcx4 import time
 from mcx4.microcontrollers import Microcontroller
 
+# Mutable state of a Board, see Board.snapshot().
+Snapshot = namedtuple('Snapshot', ['time', 'items', 'circuits', 'overslept'])
+
+
 class Board():
 
+    clock = None  # Clock
     _items = None  # List of items to step.
-    _sleep_until = None
+    _order = None  # {Microcontroller:position in _items}
+    _active = None  # Runnable items, in the order they were added.
+    _steppers = None  # CPU._stepper of each active item.
+    _sleepers = None  # Heap of (wake time, position, Microcontroller).
+    _parked = False  # Whether an active item has gone to sleep or blocked.
+    _woken = None  # Items unblocked since the active set was last updated.
+    _writes = None  # Ports with writes to commit at the end of the cycle.
+    _steady_interval = 0  # Cycles between steady state checks; 0 is off.
+    _recorders = None  # Trace recorders and sinks sampling after each cycle.
+    _drivers = None  # Heap of (time, order, driver) of stimulus drivers.
+    _scheduled = 0  # Drivers scheduled so far, to order ties.
+    _halted = False  # Whether a driver asked to stop running.
+    _overslept = None  # Wake time already used up by a run that ended on it.
 
-    def __init__(self):
-        if time.get() is None:
-            time.advance_cycle()
+    def __init__(self, clock=None):
+        """
+        Every Board keeps its own time unless a Clock is given.
+        """
+        self.clock = clock or time.Clock()
+        if self.clock.get() is None:
+            self.clock.advance_cycle()
         self._items = []
+        self._order = {}
+        self._active = []
+        self._steppers = []
+        self._sleepers = []
+        self._woken = []
+        self._writes = []
+        self._recorders = []
+        self._drivers = []
 
     def add(self, thing):
         if not isinstance(thing, Microcontroller):
             raise TypeError("Object added to board must be Microcontroller.")
-        if thing not in self._items:
+        if thing not in self._order:
+            self._order[thing] = len(self._items)
             self._items.append(thing)
-        thing.set_board(self)
+            thing.set_board(self)
+            if thing.sleeping():
+                self.sleep(thing)
+            else:
+                thing._sleep_until = None
+                self._active.append(thing)
+                self._steppers.append(thing._cpu._stepper)
+        else:
+            thing.set_board(self)
+
+    def sleep(self, thing):
+        """
+        Takes an item out of the active set until its wake time.
+        """
+        heappush(self._sleepers,
+                 (thing._sleep_until, self._order[thing], thing))
+        self._parked = True
+
+    def block(self, thing):
+        """
+        Takes an item out of the active set until unblock() is called.
+        """
+        thing._blocked = True
+        self._parked = True
+
+    def unblock(self, thing):
+        """
+        Puts a blocked item back in the active set.  It's stepped again
+        from the next cycle.
+        """
+        if not thing._blocked:
+            return
+        thing._blocked = False
+        self._woken.append(thing)
+        self._parked = True
+
+    def schedule(self, driver, time):
+        """
+        Calls driver.fire(now) at the start of cycle time, before any
+        item is stepped.  fire() returns the next time to call it, or
+        None once it's done.
+        """
+        heappush(self._drivers, (time, self._scheduled, driver))
+        self._scheduled += 1
+
+    def unschedule(self, driver):
+        self._drivers[:] = [d for d in self._drivers if d[2] is not driver]
+        heapify(self._drivers)
+
+    def halt(self):
+        """
+        Called by a driver to stop step() or run() before the cycle it
+        was fired for is stepped.
+        """
+        self._halted = True
 
     def step(self):
         """
         Step one cycle.
+
+        Only runnable items are stepped; sleeping ones wait on a heap
+        ordered by wake time, and ones blocked on an XBus wait on its
+        Circuit.
         """
         if len(self._items) == 0:
             return
-        sleeps = []
-        for i in self._items:
-            sleep = i.sleeping()
-            if sleep is False:
-                i.step()
-            else:
-                sleeps.append(sleep)
-        if len(sleeps) == len(self._items):
+        if self._parked:
+            self._refresh()
+        clock = self.clock
+        now = clock.get()
+        drivers = self._drivers
+        if drivers and drivers[0][0] <= now:
+            self._drive(now)
+            if self._halted:
+                self._halted = False
+                return
+        sleepers = self._sleepers
+        if sleepers and sleepers[0][0] <= now and now != self._overslept:
+            self._wake(now)
+        if not self._active:
             # Awww, everyone's sleeping.
             # Advance time to the next wake.
-            time.set(min(sleeps))
-        time.advance_cycle()
+            if sleepers:
+                wake = sleepers[0][0]
+                if drivers and drivers[0][0] <= wake:
+                    if self._drive_until(wake + 1) is not None:
+                        return
+                clock.set(wake)
+        else:
+            for step in self._steppers:
+                step()
+        if self._writes:
+            self._commit()
+        clock.advance_cycle()
+        for recorder in self._recorders:
+            recorder.sample(clock.get())
+
+    def run(self, cycles=None, atus=None, until=None):
+        """
+        Step until the given number of cycles or arbitrary time units
+        has passed, or until(board) returns True after a cycle, or a
+        driver calls halt(), whichever comes first.
+
+        Returns the number of (cycles, instructions) that were run.
+        """
+        if len(self._items) == 0:
+            return (0, 0)
+        clock = self.clock
+        now = start = clock.get()
+        end = None
+        if cycles is not None:
+            end = now + cycles
+        if atus is not None:
+            end = min(e for e in (end, clock.end_time(atus)) if e is not None)
+        if end is None and until is None:
+            raise ValueError("Nothing to run until.")
+        set_time = clock.set
+        sleepers = self._sleepers
+        drivers = self._drivers
+        writes = self._writes
+        recorders = self._recorders
+        insts = self.executed()
+        skipped = 0  # Instructions covered by fast-forwarding.
+        check = None  # Time of the next steady state check.
+        if (self._steady_interval and end is not None and until is None
+                and not recorders and not drivers and not self._watched()):
+            interval = self._steady_interval
+            check = now + interval
+            seen = {}  # {state:(time, instructions executed)}
+        while end is None or now < end:
+            if self._parked:
+                self._refresh()
+            if drivers and drivers[0][0] <= now:
+                self._drive(now)
+                if self._halted:
+                    self._halted = False
+                    break
+            if (sleepers and sleepers[0][0] <= now
+                    and now != self._overslept):
+                self._wake(now)
+            steppers = self._steppers
+            if steppers:
+                for step in steppers:
+                    step()
+                now += 1
+            elif sleepers:
+                # Everyone's sleeping; skip ahead to the next wake.
+                now = sleepers[0][0] + 1
+                if end is not None and now > end:
+                    if end == now - 1:
+                        # Skipping ahead uses up the wake cycle too, so
+                        # the next run mustn't wake anyone until after.
+                        self._overslept = end
+                    now = end
+                if drivers and drivers[0][0] < now:
+                    halted = self._drive_until(now)
+                    if halted is not None:
+                        now = halted
+                        break
+            elif until is None:
+                # Everyone's blocked and nothing can wake them.
+                now = end
+                if drivers and drivers[0][0] < now:
+                    halted = self._drive_until(now)
+                    if halted is not None:
+                        now = halted
+                        break
+            else:
+                now += 1
+            if writes:
+                self._commit()
+            set_time(now)
+            if recorders:
+                for recorder in recorders:
+                    recorder.sample(now)
+            if until is not None and until(self):
+                break
+            if check is not None and now >= check:
+                check = now + interval
+                state = self._state(now)
+                executed = self.executed()
+                if state in seen:
+                    then, before = seen.pop(state)
+                    period = now - then
+                    repeats = (end - now) // period
+                    if repeats:
+                        self._shift(repeats * period)
+                        now += repeats * period
+                        set_time(now)
+                        skipped += repeats * (executed - before)
+                        seen.clear()
+                elif len(seen) < 4096:
+                    seen[state] = (now, executed)
+                else:
+                    seen.clear()
+        return (now - start, self.executed() - insts + skipped)
+
+    def fast_forward(self, interval=256):
+        """
+        Lets run() spot when the whole board repeats itself, and then
+        skip ahead by whole periods instead of simulating them.
+
+        The board state is checked every interval cycles; 0 turns this
+        off.  Only use it when nothing outside the board writes to it
+        during the run.  It's skipped while anything is recording,
+        driving or subscribed to the board.
+        """
+        self._steady_interval = interval
+
+    def _watched(self):
+        """
+        Whether anything subscribed to a circuit on the board.
+        """
+        for i in self._items:
+            for p in i._ports.values():
+                if p._circuit is not None and p._circuit._subscribers:
+                    return True
+        return False
+
+    def _state(self, now):
+        """
+        Everything that decides what the board does next, with sleep
+        deadlines relative to now.
+        """
+        state = []
+        for i in self._items:
+            cpu = i._cpu
+            until = i._sleep_until
+            state.append((
+                cpu._inst_pointer, cpu._exec_plus, cpu._exec_minus,
+                tuple(r._val for r in i._registers),
+                None if until is None else until - now,
+                i._blocked,
+                tuple(self._port_state(p) for p in i._ports.values())
+            ))
+        return tuple(state)
+
+    def _port_state(self, port):
+        offer = getattr(port, '_offer', None)
+        if offer is not None and port._circuit is not None:
+            # Which writer gets read first matters too.
+            offer = (offer, port._circuit._offers.index(port))
+        return (port._output, port._next_output, offer)
+
+    def snapshot(self):
+        """
+        Captures everything that changes as the board runs: the clock,
+        and for every item its registers, instruction pointer, condition
+        flags, executed count, sleep deadline, port outputs, pending
+        writes and XBus values, plus who is waiting on each XBus.
+
+        Code, links and the items themselves aren't included, so a
+        Snapshot can only be restored to the same Board, and only XBus
+        values of parts on the Board are kept.
+        """
+        items = []
+        circuits = {}  # {Circuit:None} in the order they're found.
+        where = {}  # {port:(item position, port key)}
+        for n, i in enumerate(self._items):
+            cpu = i._cpu
+            ports = []
+            for key, p in i._ports.items():
+                ports.append((key, p._output, p._next_output,
+                              getattr(p, '_offer', None)))
+                where[p] = (n, key)
+                if p._circuit is not None:
+                    circuits[p._circuit] = None
+            items.append((
+                cpu._inst_pointer, cpu._exec_plus, cpu._exec_minus,
+                cpu._executed, i._sleep_until, i._blocked,
+                tuple(r._val for r in i._registers), tuple(ports),
+            ))
+        return Snapshot(
+            self.clock.get(),
+            tuple(items),
+            tuple(
+                (tuple(where[p] for p in c._offers if p in where),
+                 tuple(where[p] for p in c._waiters if p in where))
+                for c in circuits if c._offers or c._waiters
+            ),
+            self._overslept == self.clock.get(),
+        )
+
+    def restore(self, snap):
+        """
+        Puts the board back the way it was when snap was taken.
+        """
+        if len(snap.items) != len(self._items):
+            raise ValueError("Snapshot is of a different board.")
+        self.clock.set(snap.time)
+        writes = self._writes
+        writes.clear()
+        circuits = {}
+        sleepers = []
+        for n, (i, state) in enumerate(zip(self._items, snap.items)):
+            (ip, plus, minus, executed, until, blocked,
+             registers, ports) = state
+            cpu = i._cpu
+            cpu._inst_pointer = ip
+            cpu._exec_plus = plus
+            cpu._exec_minus = minus
+            cpu._executed = executed
+            i._sleep_until = until
+            i._blocked = blocked
+            if until is not None:
+                sleepers.append((until, n, i))
+            for r, val in zip(i._registers, registers):
+                r._val = val
+            saved = {key: p for key, *p in ports}
+            for key, p in i._ports.items():
+                # Ports made after the snapshot was taken were idle.
+                output, pending, offer = saved.get(key, (0, None, None))
+                p._output = output
+                p._next_output = pending
+                if pending is not None:
+                    writes.append(p)
+                if offer is not None or hasattr(p, '_offer'):
+                    p._offer = offer
+                if p._circuit is not None:
+                    circuits[p._circuit] = None
+        for c in circuits:
+            c._offers.clear()
+            c._waiters.clear()
+            c._recompute()
+        for offers, waiters in snap.circuits:
+            for n, key in offers:
+                p = self._items[n]._ports[key]
+                p._circuit._offers.append(p)
+            for n, key in waiters:
+                p = self._items[n]._ports[key]
+                p._circuit._waiters.append(p)
+        heapify(sleepers)
+        self._sleepers = sleepers
+        self._woken.clear()
+        self._parked = False
+        self._overslept = snap.time if snap.overslept else None
+        self._active = [
+            i for i in self._items
+            if i._sleep_until is None and not i._blocked
+        ]
+        self._steppers = [i._cpu._stepper for i in self._active]
+
+    def _shift(self, cycles):
+        """
+        Moves every sleep deadline later, for skipping ahead in time.
+        """
+        for i in self._items:
+            if i._sleep_until is not None:
+                i._sleep_until += cycles
+        self._sleepers[:] = [
+            (until + cycles, order, i) for until, order, i in self._sleepers
+        ]
+
+    def executed(self):
+        """
+        Total number of instructions executed by every item.
+        """
+        return sum(i._cpu._executed for i in self._items)
+
+    def _commit(self):
+        """
+        Ports written this cycle show their new output.
+        """
+        writes = self._writes
+        for port in writes:
+            port.commit()
+        writes.clear()
+
+    def _refresh(self):
+        """
+        Drops items that went to sleep or blocked from the active set,
+        and adds back the ones that were unblocked.
+        """
+        self._parked = False
+        active = [
+            i for i in self._active
+            if i._sleep_until is None and not i._blocked
+        ]
+        woken = self._woken
+        if woken:
+            present = set(active)
+            for i in woken:
+                if i not in present and not i._blocked:
+                    present.add(i)
+                    active.append(i)
+            woken.clear()
+            active.sort(key=self._order.__getitem__)
+        self._active = active
+        self._steppers = [i._cpu._stepper for i in active]
+
+    def _drive(self, now):
+        """
+        Fires every driver whose time has come.
+        """
+        drivers = self._drivers
+        while drivers and drivers[0][0] <= now:
+            time, order, driver = heappop(drivers)
+            time = driver.fire(now)
+            if time is not None:
+                heappush(drivers, (time, order, driver))
+
+    def _drive_until(self, end):
+        """
+        Fires drivers due before end, each in its own cycle, while time
+        is skipped with nothing being stepped.
+
+        Returns the time a driver halted at, if one did.
+        """
+        drivers = self._drivers
+        while drivers and drivers[0][0] < end:
+            now = drivers[0][0]
+            self.clock.set(now)
+            self._drive(now)
+            if self._halted:
+                self._halted = False
+                return now
+        return None
+
+    def _wake(self, now):
+        """
+        Moves every item whose wake time has come back to the active set.
+        """
+        sleepers = self._sleepers
+        active = self._active
+        while sleepers and sleepers[0][0] <= now:
+            until, order, thing = heappop(sleepers)
+            if thing._sleep_until != until:
+                continue  # Stale entry; it was put to sleep again.
+            thing._sleep_until = None
+            active.append(thing)
+        active.sort(key=self._order.__getitem__)
+        self._steppers = [i._cpu._stepper for i in active]
 
     def advance(self):
         """
         Step for one arbitrary time unit.
         """
-        end = time.end_time(1)
-        while time.get() < end:
-            self.step()
+        return self.run(atus=1)
@@ -1,20 +1,309 @@
+import hashlib
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
 import mcx4.exceptions as x
+from mcx4.interfaces import Interface, XBUS, Literal
+
+# Opcodes.
+(NOP, MOV, ADD, SUB, MUL, NOT, DGT, DST, JMP, SLP,
+ TEQ, TCP, TGT, TLT, SLX, FLG) = range(16)
+TESTS = (TEQ, TCP, TGT, TLT)
+
+# Condition flags for + and - prefixed instructions.
+ALWAYS = 0
+PLUS = 1
+MINUS = 2
+
+# Optimization levels.  CYCLES keeps one instruction per cycle, so
+# programs take exactly as long as written; SPEED drops instructions
+# that do nothing, for running straight through with execute().
+NONE = 0
+CYCLES = 1
+SPEED = 2
+
+# Registers hold three decimal digits.
+DIGITS = 3
+POW10 = tuple(10 ** n for n in range(DIGITS))
+
+# Operand kinds: r is read, w is written, l is a jump label, x is an XBus.
+# {command: (opcode, handler, operand kinds, passes ACC)}
+OPCODES = {
+    'nop': (NOP, 'do_nop', '', False),
+    'mov': (MOV, 'do_mov', 'rw', False),
+    'add': (ADD, 'do_add', 'r', True),
+    'sub': (SUB, 'do_sub', 'r', True),
+    'mul': (MUL, 'do_mul', 'r', True),
+    'not': (NOT, 'do_not', '', True),
+    'dgt': (DGT, 'do_dgt', 'r', True),
+    'dst': (DST, 'do_dst', 'rr', True),
+    'jmp': (JMP, 'do_jmp', 'l', False),
+    'slp': (SLP, 'do_slp', 'r', False),
+    'slx': (SLX, 'do_slx', 'x', False),
+    'teq': (TEQ, 'do_test', 'rr', False),
+    'tcp': (TCP, 'do_test', 'rr', False),
+    'tgt': (TGT, 'do_test', 'rr', False),
+    'tlt': (TLT, 'do_test', 'rr', False),
+}
+
+
+# Compiled code, safe to share between CPUs of the same model.
+# lines holds the (line number, source) each template came from, and
+# unreachable the line numbers of code that can never run.
+Program = namedtuple('Program', [
+    'insts', 'labels', 'templates', 'lines', 'unreachable'
+])
+
+
+class ProgramCache():
+
+    """
+    Least recently used cache of compiled Programs.
+    """
+
+    _size = 0
+    _programs = None  # OrderedDict {key:Program}
+    hits = 0
+    misses = 0
+
+    def __init__(self, size=256):
+        self._programs = OrderedDict()
+        self.resize(size)
+
+    def __len__(self):
+        return len(self._programs)
+
+    def get(self, key):
+        program = self._programs.get(key)
+        if program is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._programs.move_to_end(key)
+        return program
+
+    def put(self, key, program):
+        self._programs[key] = program
+        self._programs.move_to_end(key)
+        self._evict()
+
+    def resize(self, size):
+        if size < 0:
+            raise ValueError("Cache size can't be negative: {}".format(size))
+        self._size = size
+        self._evict()
+
+    def clear(self):
+        self._programs.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while self._programs and len(self._programs) > self._size:
+            self._programs.popitem(last=False)
+
+
+programs = ProgramCache()  # Shared by every CPU in the process.
+
+
+class Optimizer():
+
+    """
+    Rewrites the templates of a program.
+
+    At the CYCLES level every instruction is kept, but:
+
+      - tests of two literals, or of a register with itself, become
+        flag settings (FLG, with ('c', value) operands);
+      - + and - instructions whose flags are known from an earlier test
+        in the same run of code either always run or become nop;
+      - writes to null of anything but a port become nop.
+
+    At the SPEED level nops, jumps to the next instruction and code
+    that can't be reached without looping are dropped as well, and jump
+    targets and labels are renumbered.
+    """
+
+    templates = None  # [template]
+    lines = None  # [(line number, source)] of each template.
+    labels = None  # {label:template number}
+
+    def __init__(self, templates, lines, labels):
+        self.templates = list(templates)
+        self.lines = list(lines)
+        self.labels = dict(labels)
+
+    def optimize(self, level):
+        if level >= CYCLES:
+            self.fold()
+        if level >= SPEED:
+            self.strip()
+
+    def successors(self, n, loop=True):
+        """
+        Instructions that can run after instruction n.
+        """
+        op, cond, meth, specs = self.templates[n]
+        out = []
+        if op == JMP:
+            out.append(specs[0][1])
+            if cond == ALWAYS:
+                return out
+        if n + 1 < len(self.templates):
+            out.append(n + 1)
+        elif loop:
+            out.append(0)
+        return out
+
+    def reachable(self, loop=True):
+        """
+        Numbers of every instruction that can run.
+        """
+        seen = set()
+        todo = [0] if self.templates else []
+        while todo:
+            n = todo.pop()
+            if n in seen or n >= len(self.templates):
+                continue
+            seen.add(n)
+            todo.extend(self.successors(n, loop))
+        return seen
+
+    def unreachable(self):
+        """
+        Line numbers of instructions that can never run.
+        """
+        seen = self.reachable()
+        return tuple(
+            line for n, (line, source) in enumerate(self.lines)
+            if n not in seen
+        )
+
+    def fold(self):
+        targets = {
+            specs[0][1] for op, cond, meth, specs in self.templates
+            if op == JMP
+        }
+        flags = None  # (plus, minus) when known.
+        for n, template in enumerate(self.templates):
+            if n == 0 or n in targets:
+                flags = None  # Reached from somewhere else.
+            op, cond, meth, specs = template
+            if cond != ALWAYS and flags is not None:
+                if flags[0 if cond == PLUS else 1]:
+                    cond = ALWAYS
+                else:
+                    op, cond, meth, specs = (NOP, ALWAYS, 'do_nop', ())
+            if op in TESTS:
+                known = self.constant(op, specs[1], specs[2])
+                if known is not None:
+                    op, meth = FLG, 'do_flags'
+                    specs = (('c', known[0]), ('c', known[1]))
+            elif op == MOV and specs[1] == ('r', 'null') \
+                    and specs[0][0] != 'p':
+                op, cond, meth, specs = (NOP, ALWAYS, 'do_nop', ())
+            self.templates[n] = (op, cond, meth, specs)
+            if op == FLG:
+                flags = (specs[0][1], specs[1][1]) if cond == ALWAYS \
+                    else None
+            elif op in TESTS:
+                flags = None
+            elif op == JMP and cond == ALWAYS:
+                flags = None
+
+    def constant(self, op, a, b):
+        """
+        (plus, minus) of a test whose outcome is always the same.
+        """
+        if a[0] == 'i' and b[0] == 'i':
+            a, b = a[1].read(), b[1].read()
+        elif a[0] == 'r' and a == b:
+            a = b = 0  # Any register equals itself.
+        else:
+            return None
+        if op == TEQ:
+            return (a == b, a != b)
+        if op == TCP:
+            return (a > b, a < b)
+        if op == TGT:
+            return (a > b, not a > b)
+        return (a < b, not a < b)
+
+    def strip(self):
+        seen = self.reachable(loop=False)
+        keep = []
+        for n, (op, cond, meth, specs) in enumerate(self.templates):
+            if n not in seen or op == NOP:
+                continue
+            if op == JMP and specs[0][1] == n + 1:
+                continue
+            keep.append(n)
+        # Where each old instruction number ends up.
+        where = {}
+        new = len(keep)
+        for n in range(len(self.templates), -1, -1):
+            if n in seen and n in keep:
+                new = keep.index(n)
+            where[n] = new
+        templates = []
+        for n in keep:
+            op, cond, meth, specs = self.templates[n]
+            if op == JMP:
+                specs = (('j', where[specs[0][1]]),)
+            templates.append((op, cond, meth, specs))
+        self.lines = [self.lines[n] for n in keep]
+        self.labels = {l: where[n] for l, n in self.labels.items()}
+        self.templates = templates
+        if len(keep) < len(where) - 1:
+            # Jumps to the next instruction may appear after renumbering.
+            self.strip()
+
+
+def xbus_reads(op, ports):
+    """
+    [(port, values needed)] for an instruction reading more than one
+    XBus value, where ports are its operands in order, or None.
+    """
+    if op == MOV:
+        ports = ports[:1]  # The second operand is written.
+    elif op == SLX:
+        return None  # Only waits.
+    counts = OrderedDict()
+    for p in ports:
+        if isinstance(p, XBUS):
+            counts[p] = counts.get(p, 0) + 1
+    if sum(counts.values()) < 2:
+        return None
+    return list(counts.items())
+
 
 class CPU():
 
-    _insts = None  # []
-    _mc = None  # Microcontroller
-    _exec_plus = False  # Whether or not to execute +.
-    _exec_minus = False  # Whether or not to execute -.
-    _inst_pointer = 0  # Instruction pointer.
-    _labels = None  # {label:inst_num}
+    __slots__ = (
+        '_insts',  # [] Parsed tuple instructions.
+        '_program',  # [(opcode, cond, handler, args)] Decoded instructions.
+        '_mc',  # Microcontroller
+        '_exec_plus',  # Whether or not to execute +.
+        '_exec_minus',  # Whether or not to execute -.
+        '_inst_pointer',  # Instruction pointer.
+        '_executed',  # Number of instructions stepped through.
+        '_labels',  # {label:inst_num}
+        '_lines',  # [(line number, source)] of each instruction, if compiled.
+        '_unreachable',  # Line numbers of code that can never run.
+        '_stepper',  # What the Board calls to step; swapped by profilers.
+    )
 
     def __init__(self, mc=None):
         self._mc = mc
+        self._executed = 0
+        self._stepper = self.step
         self.reset()
 
     def reset(self):
         self._insts = []
+        self._lines = None
+        self._unreachable = ()
+        self._program = []
         self._exec_plus = False
         self._exec_minus = False
         self._inst_pointer = 0
@@ -24,17 +313,24 @@ class CPU():
         """
         Runs through the code once without looping.
 
-        Resets all the state stuff before it starts.
+        Resets all the state stuff before it starts.  Code is compiled
+        for SPEED, since nothing can see how many cycles it took.
         """
         self.reset()
         if isinstance(code, tuple):
-            self._insts = [code]
+            self.load([code])
         elif isinstance(code, list):
-            self._insts = code
+            self.load(code)
         else:
-            self.compile(code)
-        while self._inst_pointer < len(self._insts):
+            self.compile(code, SPEED)
+        while self._inst_pointer < len(self._program):
+            executed = self._executed
             self.step(loop=False)
+            if self._executed == executed:
+                # Nothing can write to the XBus while we wait here.
+                raise x.BlockedException(
+                    "Blocked on an XBus at instruction {}"
+                    .format(self._inst_pointer))
         self._inst_pointer = 0
 
     def step(self, loop=True):
@@ -46,38 +342,216 @@ class CPU():
 
         Cursor will be reset to 0 after all instructions are complete,
         so stepping will loop the execution, unless loop is set to False.
+
+        An instruction blocked on an XBus is left to run again once the
+        part is woken.  Instructions reading more than one XBus wait
+        until there's a value on all of them before taking any.
         """
-        if len(self._insts) == 0:
+        program = self._program
+        if not program:
             return
-        c = self.exec_inst(self._insts[self._inst_pointer])
-        if c is not None:
-            self._inst_pointer = c
+        ip = self._inst_pointer
+        op, cond, handler, args = program[ip]
+        c = None
+        try:
+            if not cond:
+                c = handler(*args)
+            elif cond == PLUS:
+                if self._exec_plus:
+                    c = handler(*args)
+            elif self._exec_minus:
+                c = handler(*args)
+        except x.BlockedException:
+            return
+        if c is None:
+            ip += 1
         else:
-            self._inst_pointer += 1
+            ip = c
         # Start over if we're done.
-        if loop and self._inst_pointer == len(self._insts):
-            self._inst_pointer = 0
+        if loop and ip == len(program):
+            ip = 0
+        self._inst_pointer = ip
+        self._executed += 1
 
     def exec_inst(self, inst):
         """
-        Executes a given compiled instruction.
+        Executes a given tuple instruction outside of the program.
 
         Returns the new cursor in case of a jump.
         """
-        command = inst[0]
-        meth = getattr(self, 'do_'+command.lower(), None)
-        if meth:
-            return meth(*inst[1:])
+        op, cond, handler, args = self.decode(inst)
+        if self.enabled(cond):
+            return handler(*args)
+
+    def enabled(self, cond):
+        """
+        Whether an instruction with the given condition flag runs now.
+        """
+        if cond == PLUS:
+            return self._exec_plus
+        if cond == MINUS:
+            return self._exec_minus
+        return True
+
+    def decode(self, inst):
+        """
+        Turns a tuple instruction into a decoded instruction:
+
+            (opcode, cond, handler, args)
+
+        The handler is bound to this CPU and operands are resolved
+        against the Microcontroller, so stepping is a plain call
+        without any string lookups.
+        """
+        return self.bind(self.template(inst))
+
+    def template(self, inst, cond=ALWAYS, labels=None):
+        """
+        Validates a tuple instruction and classifies its operands:
+
+            (opcode, cond, handler name, ((kind, value), ...))
+
+        Templates only depend on the model of the Microcontroller, so
+        they can be shared between CPUs through the program cache.
+        """
+        command = inst[0].lower()
+        if command == 'cond':
+            return self.template(inst[2], PLUS if inst[1] else MINUS, labels)
+        if command == 'test':
+            command, args = 't'+inst[1], inst[2]
         else:
+            args = inst[1:]
+        if command not in OPCODES:
+            if command[0] == 't':
+                raise x.CommandException("Invalid comparison: "+command[1:])
             raise x.CommandException("Invalid instruction: "+command)
+        op, meth, kinds, acc = OPCODES[command]
+        if len(args) != len(kinds):
+            raise x.CommandException(
+                "{} expects {} operand(s), got {}"
+                .format(command, len(kinds), len(args))
+            )
+        if labels is None:
+            labels = self._labels
+        specs = tuple(
+            self.classify(k, a, labels) for k, a in zip(kinds, args)
+        )
+        if acc and self._mc is not None:
+            specs = (('r', 'acc'),) + specs
+        if op in TESTS:
+            specs = (('m', 'test_'+command[1:]),) + specs
+        return (op, cond, meth, specs)
+
+    def classify(self, kind, name, labels):
+        """
+        Works out once, at compile time, whether an operand is a
+        Register, a port or a Literal so execution never parses strings.
 
-    def compile(self, code):
+        Labels are resolved to their instruction number.
+        """
+        if kind == 'l':
+            if name not in labels:
+                raise x.LabelException("Label not found: "+name)
+            return ('j', labels[name])
+        if self._mc is None:
+            return ('l', name)
+        operand = self._mc.operand(name)
+        if kind == 'x' and not isinstance(operand, XBUS):
+            raise x.CommandException("Not an XBus port: "+name)
+        if isinstance(operand, Literal):
+            if kind == 'w':
+                raise x.RegisterException("Invalid register: "+name)
+            return ('i', operand)
+        if isinstance(operand, Interface):
+            return ('p', name.lower())
+        return ('r', name.lower())
+
+    def bind(self, template):
+        """
+        Resolves a template's operands into this CPU's handler and the
+        Microcontroller's own Registers and ports.
+        """
+        op, cond, meth, specs = template
+        mc = self._mc
+        args = []
+        for kind, val in specs:
+            if kind == 'r':
+                val = mc.register(val)
+            elif kind == 'p':
+                val = mc.get_port(val)
+            elif kind == 'm':
+                val = getattr(self, val)
+            args.append(val)
+        handler = getattr(self, meth)
+        waits = xbus_reads(op, args)
+        if waits:
+            handler = self._waiting(handler, waits)
+        return (op, cond, handler, tuple(args))
+
+    @staticmethod
+    def _waiting(handler, waits):
+        """
+        Wraps handler to wait for values on several XBus ports at once,
+        so none is taken while another one still has to be waited for.
         """
-        Compiles a string of code into a list of tuple instructions.
+        def waiting(*args):
+            for port, count in waits:
+                port.wait(count)
+            return handler(*args)
+        return waiting
+
+    def load(self, insts):
+        """
+        Decodes a list of tuple instructions into the running program.
+        """
+        self._insts = insts
+        self._lines = None
+        self._unreachable = ()
+        self._program = [self.decode(inst) for inst in insts]
+
+    def compile(self, code, level=CYCLES):
+        """
+        Compiles a string of code into a list of tuple instructions,
+        then decodes them into the program the CPU steps through.
+
+        Programs are optimized to the given level (see Optimizer) and
+        shared through the process-wide cache, so compiling the same
+        code for the same model of Microcontroller only parses it once.
 
         Replaces any current instruction set with this one.
 
         Doesn't reset registers.
+        """
+        key = self.program_key(code, level)
+        program = programs.get(key)
+        if program is None:
+            program = self.translate(code, level)
+            programs.put(key, program)
+        # Parsed instructions and labels are shared with the cache.
+        self._insts = program.insts
+        self._labels = program.labels
+        self._lines = program.lines
+        self._unreachable = program.unreachable
+        self._program = [self.bind(t) for t in program.templates]
+        return list(self._insts)  # Only used for testing.
+
+    def unreachable(self):
+        """
+        Line numbers of compiled code that can never run.
+        """
+        return self._unreachable
+
+    def program_key(self, code, level=CYCLES):
+        """
+        Content address of compiled code for this CPU's model.
+        """
+        model = None if self._mc is None else self._mc.model
+        return (hashlib.sha1(code.encode('utf-8')).digest(), model, level)
+
+    def translate(self, code, level=NONE):
+        """
+        Parses a string of code into an immutable Program, optimized to
+        the given level.
 
         Code looks like:
 
@@ -86,25 +560,28 @@ class CPU():
             - mov 100 p0     # This is a comment.
               add p0
 
-        Compiled looks like:
+        Parsed instructions look like:
 
-            [
+            (
                 ('test', 'eq', ('p0', 'p1')),
                 ('cond', True, ('mov', 'p0', 'p1')),
                 ('cond', False, ('mov', '100', 'p0')),
                 ('add', 'p0')
-            ]
+            )
 
         """
         out = []
+        labels = {}
+        sources = []
         lines = code.split('\n')
         i = 0  # Instruction number (lines can be null and don't count)
-        for l in lines:
+        for number, l in enumerate(lines, 1):
+            source = l.strip()
             l = l.split(';')[0]  # Strip comments and whitespace.
             l = l.split('#')[0]
             if ':' in l:  # Record and strip labels.
                 label = l.split(':')
-                self._labels[label[0].strip()] = i
+                labels[label[0].strip()] = i
                 if len(label) == 2:
                     l = label[1]
                 else:
@@ -112,8 +589,8 @@ class CPU():
             l = l.strip()
             if l == '':
                 continue
-            i += i  # Increment the instruction number.
-            inst = tuple(l.split(' '))
+            i += 1  # Increment the instruction number.
+            inst = tuple(l.split())
             if inst[0] == '+':
                 inst = ('cond', True, inst[1:])
             if inst[0] == '-':
@@ -121,95 +598,87 @@ class CPU():
             if inst[0][0] == 't':
                 inst = ('test', inst[0][1:], inst[1:])
             out.append(inst)
-        self._insts = out
-        return out  # Only used for testing.
-
-    def do_add(self, a):
-        a = self._mc.value(a)
-        self._mc.register('acc').write(self._mc.acc + a)
-
-    def do_sub(self, a):
-        a = self._mc.value(a)
-        self._mc.register('acc').write(self._mc.acc - a)
-
-    def do_mul(self, a):
-        a = self._mc.value(a)
-        acc = self._mc.register('acc')
-        acc.write(acc.read()*a)
-
-    def do_not(self):
-        acc = self._mc.register('acc')
+            sources.append((number, source))
+        templates = tuple(self.template(inst, labels=labels) for inst in out)
+        optimizer = Optimizer(templates, sources, labels)
+        unreachable = optimizer.unreachable()
+        if self._mc is not None:
+            optimizer.optimize(level)
+        return Program(
+            tuple(out), MappingProxyType(optimizer.labels),
+            tuple(optimizer.templates), tuple(optimizer.lines), unreachable,
+        )
+
+    def do_add(self, acc, a):
+        acc.write(acc.read() + a.read())
+
+    def do_sub(self, acc, a):
+        acc.write(acc.read() - a.read())
+
+    def do_mul(self, acc, a):
+        acc.write(acc.read() * a.read())
+
+    def do_not(self, acc):
         if acc.read() == 0:
             acc.write(100)
         else:
             acc.write(0)
 
-    def do_dgt(self, bit):
+    def do_dgt(self, acc, bit):
         """
-        Rewrite ACC with one isolated digit.
+        Rewrite ACC with one isolated digit, keeping its sign.
 
         Decimal little-endian.
         """
-        bit = self._mc.value(bit)
-        acc = self._mc.register('acc')
-        val = str(acc.read())[::-1]
-        if len(val) > bit:
-            acc.write(val[bit])
-        else:
+        bit = bit.read()
+        val = acc.read()
+        if not 0 <= bit < DIGITS:
             acc.write(0)
+        elif val < 0:
+            acc.write(-(-val // POW10[bit] % 10))
+        else:
+            acc.write(val // POW10[bit] % 10)
 
-    def do_dst(self, bit, val):
+    def do_dst(self, acc, bit, val):
         """
         Set ACC digit to the least significant digit of the provided
-        value.  Decimal little-endian.
-        """
-        bit = self._mc.value(bit)
-        bit = int(str(bit)[-1])  # Least significant digit.
-        val = self._mc.value(val)
-        val = str(val)[-1]  # Least significant digit.
-        acc = self._mc.register('acc')
-        new = list(str(acc.read())[::-1])
-        if len(new) > bit:
-            new[bit] = val
-            new = str(''.join(new[::-1]))
-        else:
-            new = 0
-        acc.write(new)
+        value, keeping the sign of ACC.  Decimal little-endian.
+
+        Digits that don't exist leave ACC unchanged.
+        """
+        bit = bit.read()
+        if not 0 <= bit < DIGITS:
+            return
+        digit = abs(val.read()) % 10
+        cur = acc.read()
+        mag = abs(cur)
+        p = POW10[bit]
+        mag += (digit - mag // p % 10) * p
+        acc.write(-mag if cur < 0 else mag)
 
     def do_mov(self, a, b):
-        a = self._mc.value(a)
-        r2 = self._mc.interface(b)
-        if r2 is None:
-            raise x.RegisterException("Invalid register: "+b)
-        r2.write(a)
+        b.write(a.read())
 
-    def do_jmp(self, label):
-        if label not in self._labels:
-            raise x.LabelException("Label not found: "+label)
-        return self._labels[label]
+    def do_jmp(self, target):
+        return target
 
     def do_nop(self):
         pass  # Easiest instruction ever.
 
     def do_slp(self, a):
-        a = self._mc.value(a)
-        self._mc.sleep(a)
-
-    def do_test(self, comp, args):
-        meth = getattr(self, 'test_'+comp, None)
-        if meth is None:
-            raise x.CommandException("Invalid comparison: "+comp)
-        a = self._mc.value(args[0])
-        b = self._mc.value(args[1])
-        plus, minus = meth(a, b)  # Execute + or -.
+        self._mc.sleep(a.read())
+
+    def do_slx(self, port):
+        port.wait()
+
+    def do_flags(self, plus, minus):
         self._exec_plus = plus
         self._exec_minus = minus
 
-    def do_cond(self, plus, inst):
-        if plus and self._exec_plus:
-            return self.exec_inst(inst)
-        elif plus is False and self._exec_minus:
-            return self.exec_inst(inst)
+    def do_test(self, meth, a, b):
+        plus, minus = meth(a.read(), b.read())  # Execute + or -.
+        self._exec_plus = plus
+        self._exec_minus = minus
 
     def test_eq(self, a, b):
         return (a == b, a != b)
@@ -4,4 +4,5 @@ class PortCompatException(PortException): pass
 class RegisterException(PortException): pass
 class RunException(Exception): pass
 class LabelException(RunException): pass
-class CommandException(RunException): pass
\ No newline at end of file
+class CommandException(RunException): pass
+class BlockedException(RunException): pass
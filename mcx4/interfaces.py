@@ -1,40 +1,66 @@
 import mcx4.exceptions as x
-from mcx4 import time
+
+# Range of values a register can hold.
+MIN_VALUE = -999
+MAX_VALUE = 999
 
 
 class Interface():
 
-    _parent = None  # Microcontroller
-    _output = 0  # Output buffer.
-    _next_output = None
-    _write_time = None
-    _circuit = None
-    _name = ""
+    __slots__ = (
+        '_parent',  # Microcontroller
+        '_output',  # Output buffer.
+        '_next_output',  # Write waiting for the end of the cycle.
+        '_circuit',  # Circuit
+        '_name',
+    )
 
     def __init__(self, mc, name):
         self._parent = mc
-        self._links = []
+        self._output = 0
+        self._next_output = None
+        self._circuit = None
         self._name = name
 
     def write(self, val):
-        if self.output == val:
-            return  # Nothing necessary.
-        if self._parent._board is None:
-            self._output = val
+        """
+        On a Board, writes show up when the Board commits them at the
+        end of the cycle.  Otherwise they show up immediately.
+        """
+        board = self._parent._board
+        if board is None:
+            self._set_output(val)
+        elif self._next_output is None:
+            if self._output == val:
+                return  # Nothing necessary.
+            self._next_output = val
+            board._writes.append(self)
         else:
-            t = time.get()
             self._next_output = val
-            self._write_time = t
+
+    def commit(self):
+        """
+        Makes a buffered write show up.
+        """
+        val = self._next_output
+        self._next_output = None
+        self._set_output(val)
 
     def read(self):
         """
         Returns the maximum output of all attached ports.
         """
-        self._output = 0
+        self._set_output(0)
         if self._circuit is None:
             return 0
         return self._circuit.max_value(self)
 
+    def _set_output(self, val):
+        old = self._output
+        self._output = val
+        if self._circuit is not None and old != val:
+            self._circuit.changed(old, val)
+
     def link(self, port):
         if not isinstance(port, Interface):
             raise TypeError("Invalid port type: "+port.__class__.__name__)
@@ -42,12 +68,35 @@ class Interface():
         if c is None:
             c = self._circuit or Circuit()
         c.link(self, port)
+        old = self._circuit
+        if old is not None and old is not c and old._subscribers:
+            for target in list(old._subscribers):
+                c.subscribe(target)
         self._circuit = c
         port._circuit = c
 
+    def subscribe(self, target):
+        """
+        Calls target(cycle, value), or puts (cycle, value) on it if it's
+        a queue, whenever the value of this port's circuit changes.
+
+        See Circuit.subscribe.
+        """
+        if self._circuit is None:
+            # Nothing linked yet; the port is a circuit of its own.
+            c = Circuit()
+            c.link(self)
+            self._circuit = c
+        return self._circuit.subscribe(target)
+
+    def unsubscribe(self, target):
+        if self._circuit is not None:
+            self._circuit.unsubscribe(target)
+
     def unlink(self):
-        self._circuit.unlink(self)
+        c = self._circuit
         self._circuit = None
+        c.unlink(self)
 
     @property
     def parent(self):
@@ -55,11 +104,6 @@ class Interface():
 
     @property
     def output(self):
-        t = time.get()
-        if self._write_time and self._write_time < t:
-            self._output = self._next_output
-            self._next_output = None
-            self._write_time = None
         return self._output
 
     @property
@@ -69,6 +113,8 @@ class Interface():
 
 class GPIO(Interface):
 
+    __slots__ = ()
+
     def write(self, val):
         """
         GPIO values are constant signals from 0 to 100.
@@ -82,15 +128,106 @@ class GPIO(Interface):
 
 
 class XBUS(Interface):
-    pass
+
+    """
+    XBus transfers are synchronous: a write waits until a reader takes
+    the value, and a read waits until there's a value to take.
+
+    On a Board, waiting parts are parked on the Circuit and the Board
+    doesn't step them again until the other side turns up.  Off a
+    Board, writes don't wait and reading with nothing written raises
+    RunException.
+    """
+
+    __slots__ = (
+        '_offer',  # Value written but not read yet.
+    )
+
+    def __init__(self, mc, name):
+        super().__init__(mc, name)
+        self._offer = None
+
+    def write(self, val):
+        """
+        Values are -999 to 999.  The writer is parked until the value
+        is read.
+        """
+        val = int(val)
+        if val > MAX_VALUE:
+            val = MAX_VALUE
+        elif val < MIN_VALUE:
+            val = MIN_VALUE
+        c = self._circuit
+        new = self._offer is None
+        self._offer = val
+        board = self._parent._board
+        if board is not None:
+            board.block(self._parent)
+        if c is not None and new:
+            c.offer(self)
+
+    def read(self):
+        """
+        Takes a value written by another port on the circuit.
+        """
+        c = self._circuit
+        if c is not None:
+            val = c.take(self)
+            if val is not None:
+                return val
+        self._block()
+
+    def wait(self, count=1):
+        """
+        Returns once there are count values to read, without taking
+        them.
+        """
+        c = self._circuit
+        if c is None or not c.ready(self, count):
+            self._block()
+
+    def _block(self):
+        board = self._parent._board
+        if board is None:
+            raise x.RunException("Nothing to read on "+self.name)
+        if self._circuit is not None:
+            self._circuit.wait(self)
+        board.block(self._parent)
+        raise x.BlockedException(self.name)
 
 
 class Circuit():
 
-    _attached = None  # [Interface, Interface]
+    """
+    Ports linked together.  The driven value is the maximum output of
+    all of them, kept up to date as their outputs change, so reads
+    don't have to look at every port.
+
+    XBus circuits also keep the ports with a value waiting to be read,
+    and the ports whose parts are parked until one turns up.
+
+    A Circuit with subscribers becomes a WatchedCircuit until they're
+    all gone, so unwatched circuits don't pay for them.
+    """
+
+    __slots__ = (
+        '_attached',  # [Interface, Interface]
+        '_value',  # Maximum output of all attached ports.
+        'recomputes',  # Times every port had to be looked at.
+        'avoided',  # Output changes handled without looking at every port.
+        '_offers',  # [XBUS] Ports with a value to read, oldest first.
+        '_waiters',  # [XBUS] Ports parked until there's a value.
+        '_subscribers',  # [callable or queue] watching the value.
+    )
 
     def __init__(self):
         self._attached = []
+        self._value = 0
+        self.recomputes = 0
+        self.avoided = 0
+        self._offers = []
+        self._waiters = []
+        self._subscribers = None
 
     def link(self, *ports):
         for port in ports:
@@ -98,21 +235,112 @@ class Circuit():
                 continue
             self._validate_link(port)
             self._attached.append(port)
+        self._recompute()
 
     def unlink(self, port):
         self._attached.remove(port)
+        if port in self._offers:
+            self._offers.remove(port)
+        if port in self._waiters:
+            self._waiters.remove(port)
+        self._recompute()
+
+    def offer(self, port):
+        """
+        A port has a value to read; wakes everything waiting for one.
+        """
+        self._offers.append(port)
+        waiters = self._waiters
+        for p in waiters:
+            p._parent._board.unblock(p._parent)
+        waiters.clear()
+
+    def take(self, port):
+        """
+        Hands the oldest value written by another port to port, and
+        wakes its writer.  Returns None if there isn't one.
+        """
+        for p in self._offers:
+            if p is not port:
+                self._offers.remove(p)
+                val = p._offer
+                p._offer = None
+                board = p._parent._board
+                if board is not None:
+                    board.unblock(p._parent)
+                return val
+        return None
+
+    def ready(self, port, count=1):
+        """
+        Whether other ports have count values for port to read.
+        """
+        for p in self._offers:
+            if p is not port:
+                count -= 1
+                if not count:
+                    return True
+        return False
+
+    def wait(self, port):
+        """
+        Parks port until another port has a value.
+        """
+        if port not in self._waiters:
+            self._waiters.append(port)
+
+    def changed(self, old, new):
+        """
+        Called when an attached port's output goes from old to new.
+        """
+        if new >= self._value:
+            self._value = new
+            self.avoided += 1
+        elif old == self._value:
+            self._recompute()  # The maximum went down; find the new one.
+        else:
+            self.avoided += 1
 
     def max_value(self, exclude=None):
-        out = []
-        for p in self._attached:
-            out.append(p.output)
-        if len(out) > 0:
-            return max(out)
-        return 0
+        return self._value
+
+    def _recompute(self):
+        self.recomputes += 1
+        if self._attached:
+            self._value = max(p._output for p in self._attached)
+        else:
+            self._value = 0
+
+    def subscribe(self, target):
+        """
+        Calls target(cycle, value), or target.put_nowait((cycle, value))
+        for queues, whenever the value of the circuit changes.  For XBus
+        circuits that's every value that's read.
+
+        The cycle is the time on the Board when the change happened;
+        writes committed at the end of a cycle are reported with that
+        cycle.
+
+        Returns target.
+        """
+        if self._subscribers is None:
+            self._subscribers = []
+            self.__class__ = WatchedCircuit
+        if target not in self._subscribers:
+            self._subscribers.append(target)
+        return target
+
+    def unsubscribe(self, target):
+        if self._subscribers and target in self._subscribers:
+            self._subscribers.remove(target)
+            if not self._subscribers:
+                self._subscribers = None
+                self.__class__ = Circuit
 
     def _validate_link(self, port):
         for p in self._attached:
-            if not isinstance(port, p.__class__):
+            if not (isinstance(port, p.__class__)
+                    or isinstance(p, port.__class__)):
                 raise x.PortCompatException(
                     "Incompatible interfaces: {} / {}"
                     .format(self.__class__, port.__class__)
@@ -124,13 +352,56 @@ class Circuit():
             )
 
 
+class WatchedCircuit(Circuit):
+
+    """
+    A Circuit telling its subscribers about every change of value.
+    """
+
+    __slots__ = ()
+
+    def changed(self, old, new):
+        if new > self._value:
+            self._value = new
+            self.avoided += 1
+            self._publish(new)
+        else:
+            # Falls back to _recompute(), which publishes, if it went down.
+            Circuit.changed(self, old, new)
+
+    def _recompute(self):
+        before = self._value
+        Circuit._recompute(self)
+        if self._value != before:
+            self._publish(self._value)
+
+    def take(self, port):
+        val = Circuit.take(self, port)
+        if val is not None:
+            self._publish(val)
+        return val
+
+    def _publish(self, value):
+        if not self._attached:
+            return
+        cycle = self._attached[0]._parent._clock.get()
+        for target in list(self._subscribers):
+            if callable(target):
+                target(cycle, value)
+            else:
+                target.put_nowait((cycle, value))
+
+
 class Register():
 
-    _val = 0
-    _name = ''
-    _parent = None  # Microcontroller, probably.
+    __slots__ = (
+        '_val',
+        '_name',
+        '_parent',  # Microcontroller, probably.
+    )
 
     def __init__(self, parent, name=''):
+        self._val = 0
         self._name = name
         self._parent = parent
 
@@ -138,13 +409,21 @@ class Register():
         return self._val
 
     def write(self, val):
-        self._val = int(val)
+        """
+        Values are saturated to the -999 to 999 range of the hardware.
+        """
+        val = int(val)
+        if val > MAX_VALUE:
+            val = MAX_VALUE
+        elif val < MIN_VALUE:
+            val = MIN_VALUE
+        self._val = val
 
     def inc(self, n=1):
-        self._val += 1
+        self.write(self._val + n)
 
     def dec(self, n=1):
-        self._val -= n
+        self.write(self._val - n)
 
 
 class NullRegister(Register):
@@ -153,5 +432,22 @@ class NullRegister(Register):
     Supports read and write, but always returns 0.
     """
 
+    __slots__ = ()
+
     def write(self, val):
         pass
+
+
+class Literal():
+
+    """
+    A constant instruction operand.  Supports read only.
+    """
+
+    __slots__ = ('_val',)
+
+    def __init__(self, val):
+        self._val = int(val)
+
+    def read(self):
+        return self._val
@@ -0,0 +1,465 @@
+"""
+Translates decoded programs into Python source, compiled once and
+cached, so running them doesn't dispatch through handlers.
+
+    jit.enable(mc)  # The Board now steps mc through generated code.
+    jit.execute(mc, code)  # Like mc.execute(code), in one generated call.
+
+Stepping code runs one instruction per call, like CPU.step, and keeps
+every register, flag and the instruction pointer in the CPU, so the
+rest of the simulator (snapshots, profiling, tracing) sees no
+difference.  Free running code runs the whole program in one loop with
+registers and flags in local variables, writing them back at the end.
+
+Recompiling a part's code is picked up on its next step.
+"""
+import mcx4.exceptions as x
+from mcx4.cpus import (
+    ProgramCache, ALWAYS, PLUS, SPEED, DIGITS, POW10,
+    NOP, MOV, ADD, SUB, MUL, NOT, DGT, DST, JMP, SLP, TEQ, TCP, TGT, TLT, SLX,
+    FLG
+)
+from mcx4.interfaces import (
+    Interface, XBUS, Register, NullRegister, Literal, MIN_VALUE, MAX_VALUE
+)
+
+generated = ProgramCache()  # {(shape, mode):function making the code}
+
+STEP = 'step'
+FREE = 'free'
+
+
+def enable(mc):
+    """
+    Steps mc through generated code from now on.
+    """
+    cpu = mc._cpu
+    make = factory(shape(cpu), STEP)
+    cpu._stepper = make(cpu, mc, mc._registers, mc._ports, cpu._program,
+                        lambda loop=True: _restep(mc, loop))
+    if mc._board is not None:
+        mc._board._parked = True  # Pick up the new step function.
+
+
+def disable(mc):
+    """
+    Goes back to stepping mc through the CPU.
+    """
+    mc._cpu._stepper = mc._cpu.step
+    if mc._board is not None:
+        mc._board._parked = True
+
+
+def _restep(mc, loop):
+    """
+    The program changed since the code was generated.
+    """
+    enable(mc)
+    mc._cpu._stepper(loop)
+
+
+def execute(mc, code):
+    """
+    Compiles code and runs through it once without looping, like
+    Microcontroller.execute.
+
+    An XBus read that has to wait raises BlockedException instead of
+    waiting forever.
+    """
+    cpu = mc._cpu
+    cpu.reset()
+    cpu.compile(code, SPEED)
+    make = factory(shape(cpu), FREE)
+    make(cpu, mc, mc._registers, mc._ports)()
+    cpu._inst_pointer = 0
+
+
+def shape(cpu):
+    """
+    Everything the generated source depends on:
+
+        ((opcode, cond, (('i', value) or ('r', index) or ('p', key)
+          or ('x', key) or ('j', target) or ('c', flag), ...)), ...)
+
+    XBus ports are 'x' so reads of several of them can wait on all.
+    """
+    mc = cpu._mc
+    if mc is None:
+        raise x.RunException("Generated code needs a Microcontroller.")
+    registers = {id(r): n for n, r in enumerate(mc._registers)}
+    ports = {id(p): key for key, p in mc._ports.items()}
+    out = []
+    for op, cond, handler, args in cpu._program:
+        specs = []
+        for a in args:
+            if isinstance(a, Literal):
+                specs.append(('i', a._val))
+            elif isinstance(a, Register):
+                specs.append(('r', registers[id(a)]))
+            elif isinstance(a, XBUS):
+                specs.append(('x', ports[id(a)]))
+            elif isinstance(a, Interface):
+                specs.append(('p', ports[id(a)]))
+            elif isinstance(a, bool):
+                specs.append(('c', a))
+            elif isinstance(a, int):
+                specs.append(('j', a))
+            # Comparison methods are inlined from the opcode.
+        out.append((op, cond, tuple(specs)))
+    return tuple(out)
+
+
+def factory(shape, mode):
+    """
+    Cached function making the code for a program shape.
+    """
+    key = (shape, mode)
+    make = generated.get(key)
+    if make is None:
+        source = Generator(shape, mode).source()
+        namespace = {
+            'BlockedException': x.BlockedException,
+            'POW10': POW10,
+            'NullRegister': NullRegister,
+        }
+        exec(compile(source, '<mcx4 {} code>'.format(mode), 'exec'),
+             namespace)
+        make = namespace['make']
+        make.source = source
+        generated.put(key, make)
+    return make
+
+
+class Generator():
+
+    """
+    Writes the source of a function making the code for one program.
+    """
+
+    _shape = None
+    _mode = None
+    _lines = None
+    _temp = 0  # Number of temporary variables used.
+
+    def __init__(self, shape, mode):
+        self._shape = shape
+        self._mode = mode
+        self._lines = []
+
+    def source(self):
+        if self._mode == STEP:
+            self._step()
+        else:
+            self._free()
+        return "\n".join(self._lines)+"\n"
+
+    def emit(self, depth, line):
+        self._lines.append("    " * depth + line)
+
+    def _bind(self, rebind):
+        """
+        Puts every register and port the program uses in a local.
+        """
+        self.emit(0, "def make(cpu, mc, regs, ports{}):".format(
+            ", program, rebind" if rebind else ""))
+        registers = set()
+        ports = set()
+        for op, cond, specs in self._shape:
+            for kind, val in specs:
+                if kind == 'r':
+                    registers.add(val)
+                elif kind in ('p', 'x'):
+                    ports.add(val)
+        for n in sorted(registers):
+            self.emit(1, "r{0} = regs[{0}]".format(n))
+        for key in sorted(ports):
+            self.emit(1, "p_{0} = ports[{0!r}]".format(key))
+        return sorted(registers)
+
+    def _step(self):
+        self._bind(True)
+        size = len(self._shape)
+        self.emit(1, "def step(loop=True):")
+        self.emit(2, "if cpu._program is not program:")
+        self.emit(3, "return rebind(loop)")
+        if not size:
+            self.emit(2, "return")
+            self.emit(1, "return step")
+            return
+        self.emit(2, "ip = cpu._inst_pointer")
+        self.emit(2, "try:")
+        self._dispatch(3, 0, size)
+        self.emit(2, "except BlockedException:")
+        self.emit(3, "return")
+        self.emit(2, "if loop and ip == {}:".format(size))
+        self.emit(3, "ip = 0")
+        self.emit(2, "cpu._inst_pointer = ip")
+        self.emit(2, "cpu._executed += 1")
+        self.emit(1, "return step")
+
+    def _dispatch(self, depth, start, end):
+        """
+        Binary search over the instruction pointer, leaving the next
+        instruction pointer in ip.
+        """
+        if end - start == 1:
+            self._inst(depth, start, self._shape[start])
+            return
+        mid = (start + end) // 2
+        self.emit(depth, "if ip < {}:".format(mid))
+        self._dispatch(depth + 1, start, mid)
+        self.emit(depth, "else:")
+        self._dispatch(depth + 1, mid, end)
+
+    def _free(self):
+        registers = self._bind(False)
+        size = len(self._shape)
+        self.emit(1, "def run():")
+        for n in registers:
+            self.emit(2, "v{0} = r{0}._val".format(n))
+        self.emit(2, "plus = cpu._exec_plus")
+        self.emit(2, "minus = cpu._exec_minus")
+        self.emit(2, "ip = cpu._inst_pointer")
+        self.emit(2, "executed = 0")
+        self.emit(2, "try:")
+        self.emit(3, "while ip < {}:".format(size))
+        blocks = self._blocks()
+        for n, (start, end) in enumerate(blocks):
+            self.emit(4, "{} ip == {}:".format("if" if n == 0 else "elif",
+                                              start))
+            self.emit(5, "executed += {}".format(end - start))
+            self.emit(5, "ip = {}".format(end))
+            for i in range(start, end):
+                self._inst(5, i, self._shape[i])
+        self.emit(2, "finally:")
+        for n in registers:
+            if n != 1:  # null
+                self.emit(3, "r{0}._val = v{0}".format(n))
+        self.emit(3, "cpu._exec_plus = plus")
+        self.emit(3, "cpu._exec_minus = minus")
+        self.emit(3, "cpu._inst_pointer = ip")
+        self.emit(3, "cpu._executed += executed")
+        self.emit(1, "return run")
+
+    def _blocks(self):
+        """
+        [(start, end)] of runs of instructions always executed together:
+        they start at jump targets and end after jumps.
+        """
+        starts = {0}
+        for n, (op, cond, specs) in enumerate(self._shape):
+            if op == JMP:
+                starts.add(specs[0][1])
+                starts.add(n + 1)
+        starts = sorted(s for s in starts if s < len(self._shape))
+        ends = starts[1:] + [len(self._shape)]
+        return list(zip(starts, ends))
+
+    def _inst(self, depth, n, inst):
+        """
+        Inlines instruction n.  In stepping code, ip is set to the next
+        instruction first.
+        """
+        op, cond, specs = inst
+        step = self._mode == STEP
+        if step:
+            self.emit(depth, "ip = {}".format(n + 1))
+        if cond != ALWAYS:
+            flag = 'plus' if cond == PLUS else 'minus'
+            if step:
+                flag = 'cpu._exec_'+flag
+            self.emit(depth, "if {}:".format(flag))
+            depth += 1
+        start = len(self._lines)
+        self._waits(depth, op, specs)
+        getattr(self, '_op_'+OPNAMES[op])(depth, specs)
+        if len(self._lines) == start:
+            self.emit(depth, "pass")
+
+    def _waits(self, depth, op, specs):
+        """
+        Waits for every XBus value an instruction reads before taking
+        any, like cpus.xbus_reads.
+        """
+        if op == SLX:
+            return
+        reads = specs[:1] if op == MOV else specs
+        counts = {}
+        for kind, val in reads:
+            if kind == 'x':
+                counts[val] = counts.get(val, 0) + 1
+        if sum(counts.values()) < 2:
+            return
+        for key in sorted(counts):
+            self.emit(depth, "p_{}.wait({})".format(key, counts[key]))
+
+    def read(self, spec):
+        kind, val = spec
+        if kind == 'i':
+            return repr(val)
+        if kind in ('p', 'x'):
+            return "p_{}.read()".format(val)
+        if val == 1:
+            return "0"  # null
+        if self._mode == STEP:
+            return "r{}._val".format(val)
+        return "v{}".format(val)
+
+    def write(self, depth, spec, expr, saturate=True):
+        kind, val = spec
+        if kind in ('p', 'x'):
+            self.emit(depth, "p_{}.write({})".format(val, expr))
+            return
+        if val == 1:  # null
+            if '.read()' in expr:
+                self.emit(depth, expr)  # Reading a port has side effects.
+            return
+        target = "r{}._val".format(val) if self._mode == STEP else \
+            "v{}".format(val)
+        if expr.lstrip('-').isdigit():
+            expr = repr(min(max(int(expr), MIN_VALUE), MAX_VALUE))
+        elif saturate:
+            t = self.temp()
+            self.emit(depth, "{} = {}".format(t, expr))
+            expr = "{max} if {t} > {max} else {min} if {t} < {min} else {t}" \
+                .format(t=t, max=MAX_VALUE, min=MIN_VALUE)
+        self.emit(depth, "{} = {}".format(target, expr))
+
+    def temp(self):
+        self._temp += 1
+        return "t{}".format(self._temp)
+
+    def _op_nop(self, depth, specs):
+        pass
+
+    def _op_mov(self, depth, specs):
+        a, b = specs
+        # Registers and ports only hold values in range already.
+        self.write(depth, b, self.read(a), saturate=a[0] == 'i')
+
+    def _arith(self, depth, specs, sign):
+        acc, a = specs
+        self.write(depth, acc, "{} {} {}".format(
+            self.read(acc), sign, self.read(a)))
+
+    def _op_add(self, depth, specs):
+        self._arith(depth, specs, '+')
+
+    def _op_sub(self, depth, specs):
+        self._arith(depth, specs, '-')
+
+    def _op_mul(self, depth, specs):
+        self._arith(depth, specs, '*')
+
+    def _op_not(self, depth, specs):
+        acc, = specs
+        self.write(depth, acc, "100 if {} == 0 else 0".format(
+            self.read(acc)), saturate=False)
+
+    def _op_dgt(self, depth, specs):
+        acc, bit = specs
+        if bit[0] == 'i':
+            self._dgt_literal(depth, acc, bit[1])
+            return
+        b = self.temp()
+        v = self.temp()
+        self.emit(depth, "{} = {}".format(b, self.read(bit)))
+        self.emit(depth, "{} = {}".format(v, self.read(acc)))
+        self.emit(depth, "if not 0 <= {} < {}:".format(b, DIGITS))
+        self.write(depth + 1, acc, "0")
+        self.emit(depth, "elif {} < 0:".format(v))
+        self.write(depth + 1, acc, "-(-{} // POW10[{}] % 10)".format(v, b),
+                   saturate=False)
+        self.emit(depth, "else:")
+        self.write(depth + 1, acc, "{} // POW10[{}] % 10".format(v, b),
+                   saturate=False)
+
+    def _dgt_literal(self, depth, acc, bit):
+        if not 0 <= bit < DIGITS:
+            self.write(depth, acc, "0")
+            return
+        v = self.temp()
+        self.emit(depth, "{} = {}".format(v, self.read(acc)))
+        self.write(depth, acc, "-(-{v} // {p} % 10) if {v} < 0 else "
+                   "{v} // {p} % 10".format(v=v, p=POW10[bit]),
+                   saturate=False)
+
+    def _op_dst(self, depth, specs):
+        acc, bit, val = specs
+        if bit[0] == 'i':
+            if 0 <= bit[1] < DIGITS:
+                self._dst(depth, acc, repr(POW10[bit[1]]), val)
+            return  # Digits that don't exist leave ACC unchanged.
+        b = self.temp()
+        self.emit(depth, "{} = {}".format(b, self.read(bit)))
+        self.emit(depth, "if 0 <= {} < {}:".format(b, DIGITS))
+        self._dst(depth + 1, acc, "POW10[{}]".format(b), val)
+
+    def _dst(self, depth, acc, power, val):
+        d = self.temp()
+        v = self.temp()
+        m = self.temp()
+        self.emit(depth, "{} = abs({}) % 10".format(d, self.read(val)))
+        self.emit(depth, "{} = {}".format(v, self.read(acc)))
+        self.emit(depth, "{} = abs({})".format(m, v))
+        self.emit(depth, "{m} += ({d} - {m} // {p} % 10) * {p}".format(
+            m=m, d=d, p=power))
+        self.write(depth, acc, "-{m} if {v} < 0 else {m}".format(m=m, v=v),
+                   saturate=False)
+
+    def _op_jmp(self, depth, specs):
+        (kind, target), = specs
+        self.emit(depth, "ip = {}".format(target))
+        if self._mode == FREE:
+            self.emit(depth, "continue")
+
+    def _op_slp(self, depth, specs):
+        a, = specs
+        self.emit(depth, "mc.sleep({})".format(self.read(a)))
+
+    def _op_slx(self, depth, specs):
+        (kind, key), = specs
+        self.emit(depth, "p_{}.wait()".format(key))
+
+    def _test(self, depth, specs, plus, minus):
+        a, b = specs
+        ta = self.temp()
+        tb = self.temp()
+        self.emit(depth, "{} = {}".format(ta, self.read(a)))
+        self.emit(depth, "{} = {}".format(tb, self.read(b)))
+        if self._mode == STEP:
+            self.emit(depth, "cpu._exec_plus = {}".format(
+                plus.format(a=ta, b=tb)))
+            self.emit(depth, "cpu._exec_minus = {}".format(
+                minus.format(a=ta, b=tb)))
+        else:
+            self.emit(depth, "plus = {}".format(plus.format(a=ta, b=tb)))
+            self.emit(depth, "minus = {}".format(minus.format(a=ta, b=tb)))
+
+    def _op_flg(self, depth, specs):
+        (kind, plus), (kind, minus) = specs
+        if self._mode == STEP:
+            self.emit(depth, "cpu._exec_plus = {}".format(plus))
+            self.emit(depth, "cpu._exec_minus = {}".format(minus))
+        else:
+            self.emit(depth, "plus = {}".format(plus))
+            self.emit(depth, "minus = {}".format(minus))
+
+    def _op_teq(self, depth, specs):
+        self._test(depth, specs, "{a} == {b}", "{a} != {b}")
+
+    def _op_tcp(self, depth, specs):
+        self._test(depth, specs, "{a} > {b}", "{a} < {b}")
+
+    def _op_tgt(self, depth, specs):
+        self._test(depth, specs, "{a} > {b}", "not {a} > {b}")
+
+    def _op_tlt(self, depth, specs):
+        self._test(depth, specs, "{a} < {b}", "not {a} < {b}")
+
+
+OPNAMES = {
+    NOP: 'nop', MOV: 'mov', ADD: 'add', SUB: 'sub', MUL: 'mul', NOT: 'not',
+    DGT: 'dgt', DST: 'dst', JMP: 'jmp', SLP: 'slp', TEQ: 'teq', TCP: 'tcp',
+    TGT: 'tgt', TLT: 'tlt', SLX: 'slx', FLG: 'flg',
+}
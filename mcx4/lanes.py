@@ -0,0 +1,245 @@
+"""
+Runs one program over many input vectors at once with NumPy.
+
+Each lane behaves exactly like the program running on a Microcontroller
+that is alone on its own Board, with its GPIO inputs driven from outside.
+ACC, DAT, the instruction pointer, the +/- flags and port outputs are held
+as arrays over all lanes, and every cycle each decoded instruction is
+applied to the lanes currently sitting on it.
+
+Requires NumPy.
+"""
+import numpy as np
+
+import mcx4.exceptions as x
+from mcx4 import cpus
+from mcx4.cpus import ALWAYS, PLUS, DIGITS, POW10
+from mcx4.interfaces import (
+    GPIO, XBUS, Register, NullRegister, Literal, MIN_VALUE, MAX_VALUE
+)
+from mcx4.time import Clock
+
+
+class Lanes():
+
+    """
+    Vectorised copies of one Microcontroller program.
+
+        lanes = Lanes(MC4000, code, 10000)
+        lanes.run(cycles=5000, inputs={'p0': values})
+        lanes.register('acc')  # One ACC value per lane.
+        lanes.output('p1')  # One p1 output per lane.
+
+    Input arrays have one value per lane, or one row of values per lane
+    with a column for each cycle of the run.  Ports without an input
+    aren't linked.
+    """
+
+    _mc = None  # Microcontroller used to compile the program.
+    _program = None  # Decoded program of _mc.
+    _n = 0  # Number of lanes.
+    _regs = None  # {name:array}
+    _ports = None  # {name:[output, write this cycle, was written]}
+    _ip = None  # Instruction pointer of every lane.
+    _plus = None  # Whether to execute + in every lane.
+    _minus = None  # Whether to execute - in every lane.
+    _wake = None  # Cycle each lane can run again.
+    _cycle = 0  # Cycles run so far.
+    _cycles_per_ATU = 0  # Of a Board's Clock.
+
+    def __init__(self, model, code, n):
+        self._mc = model()
+        self._mc.compile(code)
+        self._program = self._mc._cpu._program
+        self._n = n
+        zeros = lambda dtype=np.int64: np.zeros(n, dtype=dtype)
+        self._regs = {
+            r._name: zeros() for r in self._mc._registers
+            if not isinstance(r, NullRegister)
+        }
+        self._ports = {}
+        for op, cond, handler, args in self._program:
+            for a in args:
+                if isinstance(a, GPIO):
+                    self._ports.setdefault(
+                        a._name, [zeros(), zeros(), zeros(bool)])
+                elif isinstance(a, XBUS):
+                    raise x.CommandException(
+                        "XBus ports aren't supported in lanes: "+a._name)
+        self._ip = zeros()
+        self._plus = zeros(bool)
+        self._minus = zeros(bool)
+        self._wake = zeros()
+        self._cycles_per_ATU = Clock().cycles_per_ATU
+
+    def register(self, name):
+        """
+        Values of a register across all lanes.
+        """
+        reg = self._mc.register(name)
+        if isinstance(reg, NullRegister):
+            return np.zeros(self._n, dtype=np.int64)
+        return self._regs[reg._name]
+
+    def output(self, name):
+        """
+        Output of a port across all lanes, as it would be read from the
+        port by anything linked to it.
+        """
+        if name not in self._ports:
+            return np.zeros(self._n, dtype=np.int64)
+        out, pend, has = self._ports[name]
+        return np.where(has, pend, out)
+
+    @property
+    def acc(self):
+        return self.register('acc')
+
+    @property
+    def inst_pointer(self):
+        return self._ip
+
+    def run(self, cycles, inputs=None):
+        """
+        Runs every lane for a number of cycles, like Board.run.
+        """
+        inputs = {
+            name: np.clip(np.asarray(v, dtype=np.int64), 0, 100)
+            for name, v in (inputs or {}).items()
+        }
+        size = len(self._program)
+        if size == 0:
+            self._cycle += cycles
+            return
+        start = self._cycle
+        for c in range(start, start + cycles):
+            awake = self._wake <= c
+            if not awake.any():
+                continue
+            ins = {
+                name: v[:, c - start] if v.ndim == 2 else v
+                for name, v in inputs.items()
+            }
+            ip = self._ip
+            new_ip = ip + 1
+            for k in range(size):
+                here = (ip == k) & awake
+                if not here.any():
+                    continue
+                op, cond, handler, args = self._program[k]
+                if cond == PLUS:
+                    m = here & self._plus
+                elif cond != ALWAYS:
+                    m = here & self._minus
+                else:
+                    m = here
+                if m.any():
+                    target = self._exec(op, args, m, ins, c)
+                    if target is not None:
+                        new_ip = np.where(m, target, new_ip)
+            new_ip[new_ip == size] = 0
+            self._ip = np.where(awake, new_ip, ip)
+            # The board commits port writes at the end of the cycle.
+            for out, pend, has in self._ports.values():
+                out[has] = pend[has]
+                has[:] = False
+        self._cycle += cycles
+
+    def _exec(self, op, args, m, ins, c):
+        """
+        Applies one decoded instruction to the lanes in mask m.
+
+        Returns a jump target, if any.
+        """
+        if op == cpus.NOP:
+            return None
+        if op == cpus.MOV:
+            self._write(args[1], self._read(args[0], m, ins), m)
+        elif op in (cpus.ADD, cpus.SUB, cpus.MUL):
+            acc = self._regs['acc']
+            a = self._read(args[1], m, ins)
+            if op == cpus.ADD:
+                val = acc + a
+            elif op == cpus.SUB:
+                val = acc - a
+            else:
+                val = acc * a
+            self._set(acc, val, m)
+        elif op == cpus.NOT:
+            acc = self._regs['acc']
+            self._set(acc, np.where(acc == 0, 100, 0), m)
+        elif op == cpus.DGT:
+            acc = self._regs['acc']
+            bit = self._read(args[1], m, ins)
+            valid = (bit >= 0) & (bit < DIGITS)
+            p = np.asarray(POW10)[np.where(valid, bit, 0)]
+            digit = np.abs(acc) // p % 10
+            self._set(acc, np.where(valid, np.sign(acc) * digit, 0), m)
+        elif op == cpus.DST:
+            acc = self._regs['acc']
+            bit = self._read(args[1], m, ins)
+            digit = np.abs(self._read(args[2], m, ins)) % 10
+            valid = (bit >= 0) & (bit < DIGITS)
+            p = np.asarray(POW10)[np.where(valid, bit, 0)]
+            mag = np.abs(acc)
+            mag = mag + (digit - mag // p % 10) * p
+            self._set(acc, np.where(acc < 0, -mag, mag), m & valid)
+        elif op == cpus.JMP:
+            return args[0]
+        elif op == cpus.SLP:
+            # Alone on a board, a sleeping part makes the board skip
+            # ahead to its wake time, which uses up one more cycle.
+            span = self._read(args[0], m, ins) * self._cycles_per_ATU
+            wake = np.where(span <= 1, c + 1, c + span + 1)
+            self._wake = np.where(m, wake, self._wake)
+        elif op == cpus.FLG:
+            plus, minus = args
+            self._plus = np.where(m, plus, self._plus)
+            self._minus = np.where(m, minus, self._minus)
+        else:
+            meth, a, b = args
+            a = self._read(a, m, ins)
+            b = self._read(b, m, ins)
+            if op == cpus.TEQ:
+                plus, minus = a == b, a != b
+            elif op == cpus.TCP:
+                plus, minus = a > b, a < b
+            elif op == cpus.TGT:
+                plus = a > b
+                minus = ~plus
+            else:
+                plus = a < b
+                minus = ~plus
+            self._plus = np.where(m, plus, self._plus)
+            self._minus = np.where(m, minus, self._minus)
+        return None
+
+    def _read(self, operand, m, ins):
+        if isinstance(operand, Literal):
+            return np.int64(operand.read())
+        if isinstance(operand, NullRegister):
+            return np.int64(0)
+        if isinstance(operand, Register):
+            return self._regs[operand._name]
+        # Reading resets the port's own output, then sees the circuit.
+        out, pend, has = self._ports[operand._name]
+        out[m] = 0
+        if operand._name not in ins:
+            return np.zeros(self._n, dtype=np.int64)
+        return ins[operand._name]
+
+    def _write(self, operand, val, m):
+        if isinstance(operand, NullRegister):
+            return
+        if isinstance(operand, Register):
+            self._set(self._regs[operand._name], val, m)
+            return
+        val = np.clip(val, 0, 100)
+        out, pend, has = self._ports[operand._name]
+        changed = m & (out != val)
+        pend[changed] = np.broadcast_to(val, out.shape)[changed]
+        has[changed] = True
+
+    def _set(self, reg, val, m):
+        val = np.clip(val, MIN_VALUE, MAX_VALUE)
+        reg[m] = np.broadcast_to(val, reg.shape)[m]
@@ -1,6 +1,9 @@
 import mcx4.exceptions as x
+from mcx4 import cpus
 from mcx4.cpus import CPU
-from mcx4.interfaces import GPIO, XBUS, Register, NullRegister, Interface
+from mcx4.interfaces import (
+    GPIO, XBUS, Register, NullRegister, Interface, Literal
+)
 from mcx4 import time
 
 
@@ -9,37 +12,43 @@ class Microcontroller():
     _gpios = 0
     _xbuses = 0
     _dats = 0
-    
-    _registers = None  # {name:Interface}
-
-    _pnums = None  # {type:number}
-    _ports = None  # {name:[Port,Port...]}
-
-    _name = ""
 
     _part_count = 0  # static
-
-    _cpu = None  # CPU
-
-    _sleep_until = 0  # Keeps track of sleep state.
-
-    _board = None  # Board
+    _layouts = {}  # static {dat count:{register name:index}}
+
+    __slots__ = (
+        '_name',
+        '_registers',  # [Register] indexed by _layout.
+        '_layout',  # {name:index} shared by parts with as many dats.
+        '_gpio_max',  # Highest GPIO number.
+        '_xbus_max',  # Highest XBus number.
+        '_ports',  # {name:Interface}
+        '_cpu',  # CPU
+        '_sleep_until',  # Wake time while asleep.
+        '_blocked',  # Whether it's waiting on an XBus.
+        '_board',  # Board
+        '_clock',  # The Board's Clock once on a Board.
+    )
 
     def __init__(self, name=None, gpio=None, xbus=None, dats=None):
-        self._pnums = {'p':self._gpios, 'x':self._xbuses}
+        self._gpio_max = self._gpios
+        self._xbus_max = self._xbuses
         if gpio is not None:
-            self._pnums['p'] = gpio - 1
+            self._gpio_max = gpio - 1
         if xbus is not None:
-            self._pnums['x'] = xbus - 1
-        if name is not None:
-            self._name = name
-        if dats is not None:
-            self._dats = dats
-        else:
-            self._name = 'mc{}'.format(Microcontroller._part_count)
+            self._xbus_max = xbus - 1
+        if name is None:
+            name = 'mc{}'.format(Microcontroller._part_count)
+        self._name = name
+        if dats is None:
+            dats = self._dats
         Microcontroller._part_count += 1
-        self._initialize_registers()
-        self._ports = {'p':{}, 'x':{}}
+        self._initialize_registers(dats)
+        self._ports = {}
+        self._sleep_until = None
+        self._blocked = False
+        self._board = None
+        self._clock = time.default_clock
         self._cpu = CPU(self)
 
     def __getattr__(self, name):
@@ -55,6 +64,7 @@ class Microcontroller():
         on nonparallel cycles.
         """
         self._board = board
+        self._clock = board.clock
 
     def value(self, val):
         reg = self.interface(val)
@@ -62,6 +72,19 @@ class Microcontroller():
             return reg.read()
         return int(val)
 
+    def operand(self, name):
+        """
+        Resolves an instruction operand into a Register, a port
+        Interface or a Literal, all of which support read().
+        """
+        reg = self.interface(name)
+        if reg:
+            return reg
+        try:
+            return Literal(name)
+        except ValueError:
+            raise x.RegisterException("Invalid register: "+name)
+
     def interface(self, name):
         name = name.lower()
         try:
@@ -78,19 +101,21 @@ class Microcontroller():
     def get_port(self, name):
         name = name.lower()
         pclass, pnum = self._normalize_port_name(name)
-        ps = self._ports[name[0]]
-        if pnum not in ps:
-            ps[pnum] = pclass(self, name)
-        return ps[pnum]
+        key = name[0] + str(pnum)
+        port = self._ports.get(key)
+        if port is None:
+            port = self._ports[key] = pclass(self, name)
+        return port
 
     def register(self, name):
         """
         Returns either an Interface with read() and write().
         """
         name = name.lower()
-        if name in self._registers:
-            return self._registers[name]
-        raise x.RegisterException("Register not found: "+name)
+        i = self._layout.get(name)
+        if i is None:
+            raise x.RegisterException("Register not found: "+name)
+        return self._registers[i]
 
     def _normalize_port_name(self, name):
         """
@@ -104,20 +129,24 @@ class Microcontroller():
         if not pnum.isdigit():
             raise x.PortException("Invalid port number: "+pnum)
         pnum = int(pnum)
-        if self._pnums[ptype] < pnum:
+        if (self._gpio_max if ptype == 'p' else self._xbus_max) < pnum:
             raise x.PortException("Port out of supported range: "+name)
         return (pmap[ptype], pnum)
 
-    def _initialize_registers(self):
-        self._registers = {}
-        self._registers['acc'] = Register(self, 'acc')
-        self._registers['null'] = NullRegister(self, 'null')
-        for n in range(0, self._dats):
-            name = "dat{}".format(n)
-            self._registers[name] = Register(self, name)
-        if self._dats > 0:
-            # Handy alias when there's only one dat register.
-            self._registers['dat'] = self._registers['dat0']
+    def _initialize_registers(self, dats):
+        layout = Microcontroller._layouts.get(dats)
+        if layout is None:
+            layout = {'acc': 0, 'null': 1}
+            for n in range(0, dats):
+                layout["dat{}".format(n)] = n + 2
+            if dats > 0:
+                # Handy alias when there's only one dat register.
+                layout['dat'] = layout['dat0']
+            Microcontroller._layouts[dats] = layout
+        self._layout = layout
+        self._registers = [Register(self, 'acc'), NullRegister(self, 'null')]
+        for n in range(0, dats):
+            self._registers.append(Register(self, "dat{}".format(n)))
 
     def execute(self, code):
         """
@@ -125,36 +154,56 @@ class Microcontroller():
         """
         self._cpu.execute(code)
 
-    def compile(self, code):
+    def compile(self, code, level=cpus.CYCLES):
         """
-        Load code into the CPU.
+        Load code into the CPU, optimized to the given level.
 
         Replaces existing code.
         """
-        self._cpu.compile(code)
+        self._cpu.compile(code, level)
 
     def step(self):
         """
         Execute the next instruction.
         """
         if self.sleeping() is False:
-            self._cpu.step()
+            self._cpu._stepper()
 
     def sleep(self, atus):
-        self._sleep_until = time.end_time(atus)
+        self._sleep_until = self._clock.end_time(atus)
+        if self._board is not None:
+            self._board.sleep(self)
 
     def sleeping(self):
-        if time.get() is None or self._sleep_until is 0:
-            return False
-        if time.get() >= self._sleep_until:
-            self._sleep_until = 0
+        """
+        Returns the wake time if asleep, otherwise False.
+        """
+        until = self._sleep_until
+        now = self._clock.get()
+        if until is None or now is None or now >= until:
             return False
-        return self._sleep_until
+        return until
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def registers(self):
+        """
+        Every register by name, including aliases.
+        """
+        return {n: self._registers[i] for n, i in self._layout.items()}
+
+    @property
+    def model(self):
+        """
+        Identifies the part layout.  Code compiles the same way for
+        every Microcontroller of the same model.
+        """
+        return (self.__class__.__name__, self._gpio_max,
+                self._xbus_max, len(self._registers) - 2)
+
     @property
     def acc(self):
         acc = self.register('acc')
@@ -163,18 +212,24 @@ class Microcontroller():
 
 class MC4000(Microcontroller):
 
+    __slots__ = ()
+
     _gpios = 2
     _xbuses = 1
     _dats = 0
 
 class MC4000X(Microcontroller):
 
+    __slots__ = ()
+
     _gpios = 0
     _xbuses = 4
     _dats = 0
 
 class MC6000(Microcontroller):
 
+    __slots__ = ()
+
     _gpios = 2
     _xbuses = 4
     _dats = 1
@@ -0,0 +1,210 @@
+"""
+Finds out where the parts on a Board spend their cycles.
+
+    profiler = Profiler(board)
+    profiler.start()
+    board.run(cycles=100000)
+    profiler.stop()
+    print(profiler.report())
+
+While profiling, the Board calls a counting step function in place of
+each CPU's own, so parts that aren't being profiled run exactly as fast
+as before.
+"""
+from mcx4.cpus import PLUS
+
+
+class Profile():
+
+    """
+    Counts for one Microcontroller.
+
+    Instruction counts are keyed by position in the program.  A part
+    is either executing, sleeping or blocked on an XBus every cycle.
+    """
+
+    counts = None  # {instruction:times executed}
+    taken = None  # {instruction:times its + or - condition held}
+    skipped = None  # {instruction:times its + or - condition didn't}
+    executing = 0  # Cycles spent stepping through instructions.
+    sleeping = 0  # Cycles spent asleep.
+    blocked = 0  # Cycles spent waiting on an XBus.
+    _last = 0  # Time of the last step.
+    _asleep = False  # Whether the part went to sleep on the last step.
+
+    def __init__(self, now, asleep):
+        self.counts = {}
+        self.taken = {}
+        self.skipped = {}
+        self._last = now - 1
+        self._asleep = asleep
+
+    def idle(self, now):
+        """
+        Adds the cycles up to now that the part wasn't stepped.
+        """
+        gap = now - self._last - 1
+        if gap > 0:
+            if self._asleep:
+                self.sleeping += gap
+            else:
+                self.blocked += gap
+        self._last = now - 1
+
+
+class Profiler():
+
+    profiles = None  # {Microcontroller:Profile}
+    _board = None  # Board
+    _interval = 0  # Fast forward interval of the Board before starting.
+    _saved = None  # {Microcontroller:step function before starting}
+    _running = False
+
+    def __init__(self, board):
+        self._board = board
+        self.profiles = {}
+        self._saved = {}
+
+    def start(self):
+        """
+        Starts counting for every part on the Board.
+
+        Fast forwarding is turned off until stop(), since skipped
+        cycles can't be counted.
+        """
+        if self._running:
+            return
+        board = self._board
+        now = board.clock.get()
+        for mc in board._items:
+            profile = self.profiles.get(mc)
+            if profile is None:
+                profile = self.profiles[mc] = Profile(
+                    now, mc._sleep_until is not None)
+            else:
+                profile._last = now - 1
+            self._saved[mc] = mc._cpu._stepper
+            mc._cpu._stepper = self._stepper(mc, profile)
+        self._interval = board._steady_interval
+        board._steady_interval = 0
+        self._swap()
+        self._running = True
+
+    def stop(self):
+        """
+        Puts back the step function each CPU had before, which is its
+        own unless it was generated.
+        """
+        if not self._running:
+            return
+        board = self._board
+        now = board.clock.get()
+        for mc, profile in self.profiles.items():
+            profile.idle(now)
+        for mc, step in self._saved.items():
+            mc._cpu._stepper = step
+        self._saved.clear()
+        board._steady_interval = self._interval
+        self._swap()
+        self._running = False
+
+    def _swap(self):
+        board = self._board
+        board._steppers = [i._cpu._stepper for i in board._active]
+
+    def _stepper(self, mc, profile):
+        """
+        Makes a step function for mc that counts into profile.
+        """
+        cpu = mc._cpu
+        step = cpu._stepper
+        clock = mc._clock
+        counts = profile.counts
+        taken = profile.taken
+        skipped = profile.skipped
+
+        def stepper(loop=True):
+            now = clock.get()
+            if now - profile._last > 1:
+                profile.idle(now)
+            profile._last = now
+            program = cpu._program
+            if not program:
+                profile.executing += 1
+                return
+            ip = cpu._inst_pointer
+            cond = program[ip][1]
+            if cond:
+                runs = cpu._exec_plus if cond == PLUS else cpu._exec_minus
+            executed = cpu._executed
+            step(loop)
+            if cpu._executed == executed:
+                profile.blocked += 1
+                profile._asleep = False
+                return
+            profile.executing += 1
+            counts[ip] = counts.get(ip, 0) + 1
+            if cond:
+                if runs:
+                    taken[ip] = taken.get(ip, 0) + 1
+                else:
+                    skipped[ip] = skipped.get(ip, 0) + 1
+            profile._asleep = mc._sleep_until is not None
+
+        return stepper
+
+    def lines(self, mc):
+        """
+        Per instruction counts for mc, in program order:
+
+            [(line number, source, executed, taken, skipped)]
+
+        Instructions that weren't compiled from source are numbered
+        from 0 in the order they were loaded.
+        """
+        profile = self.profiles[mc]
+        cpu = mc._cpu
+        sources = cpu._lines
+        if sources is None:
+            sources = [(n, repr(i)) for n, i in enumerate(cpu._insts)]
+        return [
+            (number, source, profile.counts.get(n, 0),
+             profile.taken.get(n, 0), profile.skipped.get(n, 0))
+            for n, (number, source) in enumerate(sources)
+        ]
+
+    def states(self, mc):
+        """
+        Cycles mc spent in each state:
+
+            {'executing': n, 'sleeping': n, 'blocked': n}
+        """
+        profile = self.profiles[mc]
+        states = {
+            'executing': profile.executing,
+            'sleeping': profile.sleeping,
+            'blocked': profile.blocked,
+        }
+        if self._running:
+            # Cycles since the last step haven't been added yet.
+            gap = self._board.clock.get() - profile._last - 1
+            if gap > 0:
+                states['sleeping' if profile._asleep else 'blocked'] += gap
+        return states
+
+    def report(self):
+        """
+        Readable summary of every profiled part.
+        """
+        out = []
+        for mc in self.profiles:
+            states = self.states(mc)
+            out.append("{}: {}".format(mc.name, ", ".join(
+                "{} {}".format(n, c) for n, c in states.items())))
+            for number, source, count, taken, skipped in self.lines(mc):
+                cond = ""
+                if taken or skipped:
+                    cond = "  (taken {}, skipped {})".format(taken, skipped)
+                out.append("  {:>4} {:>10}  {}{}".format(
+                    number, count, source, cond))
+        return "\n".join(out)
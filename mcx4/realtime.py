@@ -0,0 +1,137 @@
+"""
+Runs a Board in step with the wall clock from asyncio.
+
+    runner = RealtimeRunner(board, seconds_per_ATU=0.5)
+    task = asyncio.ensure_future(runner.run())
+    await runner.write(mc1.p0, 100)
+    await runner.wait_for(mc2.p1, lambda v: v > 50)
+    runner.stop()
+
+The board runs in bursts of simulated time, then the runner awaits
+asyncio.sleep until the wall clock catches up, so other coroutines get
+to run and nothing busy-waits while parts sleep.  Since the board only
+runs between awaits, other coroutines can read and write its ports
+directly without any locking.
+"""
+import asyncio
+
+
+class RealtimeRunner():
+
+    seconds_per_ATU = 1.0  # Wall clock seconds for each ATU of the board.
+    tick = 0.01  # Wall clock seconds of simulation to run in one burst.
+    _board = None  # Board
+    _waiters = None  # [(port, predicate, Future)]
+    _running = False
+
+    def __init__(self, board, seconds_per_ATU=1.0, tick=0.01):
+        if seconds_per_ATU <= 0:
+            raise ValueError(
+                "ATUs must take some time: {}".format(seconds_per_ATU))
+        if tick <= 0:
+            raise ValueError("Tick must be positive: {}".format(tick))
+        self._board = board
+        self.seconds_per_ATU = seconds_per_ATU
+        self.tick = tick
+        self._waiters = []
+
+    @property
+    def running(self):
+        return self._running
+
+    def burst(self):
+        """
+        Number of cycles run between awaits.
+        """
+        per_atu = self._board.clock.cycles_per_ATU
+        return max(1, int(per_atu * self.tick / self.seconds_per_ATU))
+
+    async def run(self, atus=None):
+        """
+        Runs the board for a number of ATUs, or until stop().
+
+        Returns the number of cycles run.
+        """
+        board = self._board
+        clock = board.clock
+        per_atu = clock.cycles_per_ATU
+        loop = asyncio.get_running_loop()
+        first = clock.get()
+        start = loop.time()
+        end = None if atus is None else clock.end_time(atus)
+        burst = self.burst()
+        self._running = True
+        try:
+            while self._running:
+                now = clock.get()
+                if end is not None and now >= end:
+                    break
+                board.run(cycles=burst if end is None
+                          else min(burst, end - now))
+                self._notify()
+                # Aim for where the wall clock should be, so lateness
+                # in one burst doesn't add up over the run.
+                due = start + (clock.get() - first) / per_atu \
+                    * self.seconds_per_ATU
+                await asyncio.sleep(max(0, due - loop.time()))
+        finally:
+            self._running = False
+        return clock.get() - first
+
+    def stop(self):
+        """
+        Stops run() after the current burst.
+        """
+        self._running = False
+
+    def value(self, port):
+        """
+        What a port reads as, without the side effects of reading it.
+        """
+        if port._circuit is None:
+            return port._output
+        return port._circuit.max_value()
+
+    async def read(self, port):
+        return self.value(port)
+
+    async def write(self, port, value):
+        """
+        Writes to a port; on the board it shows up after the next cycle.
+        """
+        port.write(value)
+
+    async def wait_for(self, port, predicate, timeout=None):
+        """
+        Waits until predicate(value of port) is true after a burst, and
+        returns the value.
+        """
+        value = self.value(port)
+        if predicate(value):
+            return value
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((port, predicate, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            # Timing out cancels the future, so it's done either way.
+            waiter = (port, predicate, future)
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _notify(self):
+        """
+        Wakes everything waiting for a port value that has turned up.
+        """
+        if not self._waiters:
+            return
+        waiting = []
+        for port, predicate, future in self._waiters:
+            if future.done():
+                continue
+            value = self.value(port)
+            if predicate(value):
+                future.set_result(value)
+            else:
+                waiting.append((port, predicate, future))
+        self._waiters = waiting
@@ -0,0 +1,207 @@
+"""
+Drives GPIO circuits on a Board from a stream of samples.
+
+    stim = Stimulus(board, samples)
+    stim.link(mc.p0)
+    stim.start()
+    board.run(cycles=len(samples))
+
+A Stimulus is linked into a Circuit like any other GPIO port and puts
+out one sample per period, starting from the cycle it's started on.
+Samples can come from a list, an iterator or generator, or a NumPy
+array, and are only taken as they're needed.
+
+Runs of equal samples are collapsed before they get to the Board, which
+only calls on the Stimulus when its value changes, so a long waveform
+with few edges costs little more than its edges.
+"""
+from itertools import groupby
+
+from mcx4.interfaces import GPIO
+
+_CHUNK = 1 << 16  # Samples of an array looked at for changes at a time.
+
+
+class Stimulus(GPIO):
+
+    """
+    A GPIO port whose output comes from samples instead of a part.
+
+    Each sample is held for period cycles, or period ATUs if atus is
+    set.  Once the samples run out the last one is held, or the output
+    drops to 0 if hold is False, unless loop is set, which starts them
+    over.  Iterators are kept as runs of equal values on the first pass
+    so they can be looped.
+
+    Reading a Stimulus doesn't reset its output.  Snapshots of the Board
+    don't include how far through its samples a Stimulus is.
+    """
+
+    __slots__ = (
+        '_board',  # Board the Stimulus runs on.
+        '_clock',  # The Board's Clock.
+        '_source',  # Samples.
+        '_span',  # Cycles each sample is held for.
+        '_loop',
+        '_hold',
+        '_runs',  # Iterator of (value, samples) still to come.
+        '_next',  # Time the current run ends.
+    )
+
+    def __init__(self, board, source, period=1, atus=False, loop=False,
+                 hold=True, name='stimulus'):
+        super().__init__(self, name)  # It's its own part.
+        self._board = board
+        self._clock = board.clock
+        self._source = source
+        self._span = period * (board.clock.cycles_per_ATU if atus else 1)
+        if self._span < 1:
+            raise ValueError("Samples must last at least one cycle.")
+        self._loop = loop
+        self._hold = hold
+        self._runs = None
+        self._next = None
+
+    def start(self, time=None):
+        """
+        Puts out the first sample from time on, or from now.
+        """
+        self.stop()
+        if time is None:
+            time = self._clock.get()
+        self._runs = _merge(self._passes())
+        self._next = time
+        self._board.schedule(self, time)
+
+    def stop(self):
+        """
+        Stops changing the output; the current value is kept.
+        """
+        if self._runs is not None:
+            self._board.unschedule(self)
+            self._runs = None
+
+    def fire(self, now):
+        """
+        Puts out the sample for now.  Returns the time of the next
+        change, or None once the samples have run out.
+        """
+        value = None
+        end = self._next
+        while end <= now:
+            run = next(self._runs, None)
+            if run is None:
+                self._runs = None
+                if not self._hold:
+                    self._set_output(0)
+                elif value is not None:
+                    self._set_output(value)
+                return None
+            value, count = run
+            if count is None:
+                # One value looped forever.
+                self._runs = None
+                self._set_output(value)
+                return None
+            end += count * self._span
+        self._next = end
+        self._set_output(value)
+        return end
+
+    def read(self):
+        if self._circuit is None:
+            return self._output
+        return self._circuit.max_value(self)
+
+    @property
+    def name(self):
+        return self._name
+
+    def _passes(self):
+        """
+        Runs of every pass over the samples, as many as it takes.
+
+        A source of only one value looped is one run with no end, where
+        the number of samples is None.
+        """
+        source = self._source
+        if not self._loop:
+            yield from _clamped(source)
+            return
+        if iter(source) is source:
+            # Iterators can only be gone through once.
+            seen = []
+            for run in _clamped(source):
+                seen.append(run)
+                yield run
+            if len(seen) == 1:
+                yield seen[0][0], None
+            while len(seen) > 1:
+                yield from seen
+            return
+        count = 0
+        for value, samples in _clamped(source):
+            count += 1
+            yield value, samples
+        if count == 1:
+            yield value, None
+        while count > 1:
+            yield from _clamped(source)
+
+
+def runs(source):
+    """
+    (value, samples) for every run of equal samples of source, taken as
+    they're needed.
+    """
+    if hasattr(source, 'dtype'):
+        return _merge(
+            (int(value), count) for value, count in _array_runs(source))
+    return ((value, sum(1 for _ in group))
+            for value, group in groupby(source))
+
+
+def _clamped(source):
+    """
+    Runs of source, clamped the way GPIO.write() clamps them.
+    """
+    return _merge(
+        (min(max(int(value), 0), 100), count)
+        for value, count in runs(source))
+
+
+def _array_runs(source):
+    """
+    Runs of a NumPy array, found a chunk at a time.
+    """
+    import numpy as np
+    for start in range(0, len(source), _CHUNK):
+        chunk = np.asarray(source[start:start + _CHUNK])
+        edges = (np.flatnonzero(chunk[1:] != chunk[:-1]) + 1).tolist()
+        edges.append(len(chunk))
+        begin = 0
+        for end in edges:
+            yield chunk[begin], end - begin
+            begin = end
+
+
+def _merge(runs):
+    """
+    Joins runs of the same value.  A run with None samples is endless.
+    """
+    value = None
+    total = 0
+    for v, count in runs:
+        if count is None:
+            if total and v != value:
+                yield value, total
+            yield v, None
+            return
+        if v == value:
+            total += count
+            continue
+        if total:
+            yield value, total
+        value, total = v, count
+    if total:
+        yield value, total
@@ -1,31 +1,70 @@
-_cycles = None
 _cycles_per_ATU = 1000  # Cycles per arbitrary time unit.
 
 
+class Clock():
+
+    """
+    Keeps track of time for one Board and everything on it.
+    """
+
+    _cycles = None
+    _cycles_per_ATU = None  # The module's _cycles_per_ATU if None.
+
+    def __init__(self, cycles=None, cycles_per_ATU=None):
+        self._cycles = cycles
+        if cycles_per_ATU is not None:
+            self._cycles_per_ATU = cycles_per_ATU
+
+    def get(self):
+        """
+        Returns the current time in cycles.
+        """
+        return self._cycles
+
+    def set(self, time):
+        self._cycles = time
+
+    def advance_cycle(self):
+        """
+        Advance time by one cycle.
+        """
+        if self._cycles is None:  # Let others know we're tracking time.
+            self._cycles = 0
+        self._cycles += 1
+
+    def end_time(self, atus):
+        """ Returns the number of cycles after the end of the ATU. """
+        return (self._cycles or 0) + atus * self.cycles_per_ATU
+
+    @property
+    def cycles_per_ATU(self):
+        if self._cycles_per_ATU is None:
+            return _cycles_per_ATU
+        return self._cycles_per_ATU
+
+
+# Used by anything that isn't on a Board.
+default_clock = Clock()
+
+
 def get():
     """
-    Returns the current time in arbitrary time units.
+    Returns the current time of the default clock.
     """
-    global _cycles
-    return _cycles
+    return default_clock.get()
 
 
 def set(time):
-    global _cycles
-    _cycles = time
+    default_clock.set(time)
 
 
 def advance_cycle():
     """
-    Advance time by one cycle.
+    Advance the default clock by one cycle.
     """
-    global _cycles
-    if _cycles is None:  # Let other modules know we're tracking time.
-        _cycles = 0
-    _cycles += 1
+    default_clock.advance_cycle()
 
 
 def end_time(atus):
     """ Returns the number of cycles after the end of the ATU. """
-    global _cycles_per_ATU
-    return get() + atus * _cycles_per_ATU
+    return default_clock.end_time(atus)
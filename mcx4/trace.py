@@ -0,0 +1,179 @@
+"""
+Records port values on a Board into fixed size NumPy ring buffers.
+
+    recorder = TraceRecorder(board, [mc1.p0, mc2.x0], capacity=4096)
+    recorder.start()
+    board.run(cycles=10 ** 6)
+    recorder.value(mc1.p0, 5000)  # mc1.p0 when the clock read 5000.
+    recorder.edges('mc1.p0', 1000, 2000)  # (times, values) of changes.
+
+Only changes are kept, so memory is bounded by the capacity of each
+port's ring rather than the length of the run.  Once a ring is full the
+oldest changes are dropped.
+
+Ports are looked at after the Board commits each cycle, without reading
+them, so tracing doesn't change what the Board does.  XBus ports show
+the value waiting to be read, or IDLE.
+
+Requires NumPy.
+"""
+import numpy as np
+
+from mcx4.interfaces import XBUS
+
+IDLE = -1000  # XBus value when nothing is waiting to be read.
+
+
+class Ring():
+
+    """
+    Change times and values of one port, oldest first once unrolled.
+
+    Changes are gathered in lists and copied into the arrays in batches.
+    """
+
+    times = None  # Array of clock times.
+    values = None  # Array of values from then on.
+    _head = 0  # Where the next change goes.
+    _count = 0  # Number of changes kept.
+    _pending = None  # [time, value, time, value, ...] not copied yet.
+    _batch = 512  # Times and values to gather before copying.
+
+    def __init__(self, capacity):
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.int64)
+        self._pending = []
+        self._batch = 2 * min(capacity, Ring._batch)
+
+    def __len__(self):
+        return min(self._count + len(self._pending) // 2, len(self.times))
+
+    def append(self, time, value):
+        pending = self._pending
+        pending.append(time)
+        pending.append(value)
+        if len(pending) >= self._batch:
+            self.flush()
+
+    def flush(self):
+        pending = self._pending
+        if not pending:
+            return
+        size = len(self.times)
+        batch = np.array(pending, dtype=np.int64)
+        pending.clear()
+        times, values = batch[0::2], batch[1::2]
+        n = len(times)
+        head = self._head
+        first = min(n, size - head)
+        self.times[head:head + first] = times[:first]
+        self.values[head:head + first] = values[:first]
+        self.times[:n - first] = times[first:]
+        self.values[:n - first] = values[first:]
+        self._head = (head + n) % size
+        self._count = min(self._count + n, size)
+
+    def ordered(self):
+        """
+        (times, values) of every kept change, oldest first.
+        """
+        self.flush()
+        if self._count < len(self.times):
+            return self.times[:self._count], self.values[:self._count]
+        head = self._head
+        return (np.concatenate((self.times[head:], self.times[:head])),
+                np.concatenate((self.values[head:], self.values[:head])))
+
+
+class TraceRecorder():
+
+    _board = None  # Board
+    _ports = None  # [Interface]
+    _rings = None  # {port name:Ring}
+    _traced = None  # [(Interface, Ring)]
+    _last = None  # [last value of each port]
+    _start = None  # Clock time recording started.
+    _running = False
+
+    def __init__(self, board, ports, capacity=65536):
+        if capacity < 1:
+            raise ValueError("Capacity must be positive: {}".format(capacity))
+        self._board = board
+        self._ports = list(ports)
+        self._rings = {p.name: Ring(capacity) for p in self._ports}
+        self._traced = [(p, self._rings[p.name]) for p in self._ports]
+        self._last = [None] * len(self._ports)
+
+    def start(self):
+        """
+        Starts recording from the current cycle on.
+
+        Fast forwarding is skipped while recording, since skipped
+        cycles can't be looked at.
+        """
+        if self._running:
+            return
+        self._board._recorders.append(self)
+        self._running = True
+        self._start = self._board.clock.get()
+        self.sample(self._start)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._board._recorders.remove(self)
+        self._running = False
+
+    def sample(self, now):
+        """
+        Records every port whose value changed since the last sample.
+        """
+        last = self._last
+        n = 0
+        for port, ring in self._traced:
+            if port.__class__ is XBUS:
+                val = port._offer
+                if val is None:
+                    val = IDLE
+            else:
+                val = port._output
+            if val != last[n]:
+                last[n] = val
+                ring.append(now, val)
+            n += 1
+
+    def changes(self, port):
+        """
+        (times, values) of every change kept for a port, including its
+        value when recording started, oldest first.
+        """
+        return self._ring(port).ordered()
+
+    def value(self, port, time):
+        """
+        Value of a port when the clock read time.
+        """
+        times, values = self.changes(port)
+        n = np.searchsorted(times, time, side='right')
+        if n == 0:
+            raise ValueError("Cycle {} isn't in the trace.".format(time))
+        return int(values[n - 1])
+
+    def edges(self, port, start, end):
+        """
+        (times, values) of the changes from start up to but not
+        including end.
+        """
+        times, values = self.changes(port)
+        if self._start is not None:
+            # The value when recording started isn't a change.
+            start = max(start, self._start + 1)
+        a = np.searchsorted(times, start, side='left')
+        b = np.searchsorted(times, end, side='left')
+        return times[a:b], values[a:b]
+
+    def _ring(self, port):
+        name = port if isinstance(port, str) else port.name
+        if name not in self._rings:
+            raise ValueError("Port isn't traced: {}".format(name))
+        return self._rings[name]
@@ -0,0 +1,251 @@
+"""
+Checks a Board against input and expected output sequences.
+
+    result = vectors.check(
+        board,
+        inputs={'a.p0': [0, 50, 50, 100]},  # Driven during each cycle.
+        expected={'b.p1': [0, 0, 100, 100]},  # Read after each cycle.
+    )
+    if not result.passed:
+        result.cycle, result.port, result.expected, result.actual
+        result.pointers  # {controller:instruction pointer}
+
+Inputs are driven by Stimulus ports, and outputs are only looked at when
+they change or their expected value does, so a check runs about as fast
+as the Board would on its own.  The run stops as soon as an output
+differs from what was expected.
+
+Large sets of vectors can be split over worker processes, each building
+its own Board from a BoardSpec:
+
+    results = vectors.check_many(spec, [(inputs, expected), ...])
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from mcx4 import batch
+from mcx4.interfaces import Interface, XBUS
+from mcx4.stimulus import Stimulus, runs
+
+
+class VectorResult():
+
+    """
+    Outcome of checking one set of vectors.
+
+    cycle is the position in the sequences of the first difference, and
+    pointers the instruction pointer of every controller right after
+    that cycle.  They're None if everything matched.
+    """
+
+    passed = True
+    cycles = 0  # Cycles run.
+    cycle = None
+    port = None  # Name of the output that differed.
+    expected = None
+    actual = None
+    pointers = None  # {controller:instruction pointer}
+
+    def __init__(self, cycles, cycle=None, port=None, expected=None,
+                 actual=None, pointers=None):
+        self.passed = cycle is None
+        self.cycles = cycles
+        self.cycle = cycle
+        self.port = port
+        self.expected = expected
+        self.actual = actual
+        self.pointers = pointers
+
+    def __repr__(self):
+        if self.passed:
+            return "<VectorResult passed cycles={}>".format(self.cycles)
+        return "<VectorResult failed cycle={} {} expected={} actual={}>"\
+            .format(self.cycle, self.port, self.expected, self.actual)
+
+
+class _Checker():
+
+    """
+    Compares what one output reads as with its expected values.
+
+    Fired by the Board the cycle after the output or its expected value
+    changes, which is the only time a new difference can show up.
+    """
+
+    _board = None
+    _port = None
+    _runs = None  # Iterator of (expected value, cycles) still to come.
+    _expect = None  # Expected value of the current run.
+    _begin = 0  # Time the current run starts.
+    _end = 0  # Time the current run ends.
+    _value = 0  # What the output reads as.
+    _checked = 0  # Time everything before has been checked up to.
+    _due = None  # Time the Board fires this next.
+    failure = None  # (time, expected, actual) of the first difference.
+
+    def __init__(self, board, port, expected, start):
+        self._board = board
+        self._port = port
+        self._runs = runs(expected)
+        self._end = start
+        self._checked = start
+        self._next_run()
+        port.subscribe(self.changed)
+        self._value = port._circuit._value
+        self._schedule(start + 1)
+
+    def changed(self, cycle, value):
+        self._check(cycle)
+        self._value = value
+        self._schedule(cycle + 1)
+
+    def fire(self, now):
+        if now != self._due:
+            return None  # Stale; it was moved earlier.
+        self._due = None
+        self._check(now)
+        if self.failure is not None:
+            self._board.halt()
+        elif self._expect is not None:
+            if self._checked > self._begin:
+                self._due = self._end + 1
+            else:
+                self._due = self._begin + 1  # The run starts with a change.
+        return self._due
+
+    def finish(self, now):
+        self._check(now)
+        self._board.unschedule(self)
+        self._port.unsubscribe(self.changed)
+
+    def _schedule(self, time):
+        if self._due is None or time < self._due:
+            self._due = time
+            self._board.schedule(self, time)
+
+    def _check(self, time):
+        """
+        Checks everything before time, when the output was _value.
+        """
+        while (self._checked < time and self._expect is not None
+               and self.failure is None):
+            if self._expect != self._value:
+                self.failure = (self._checked, self._expect, self._value)
+            elif self._end <= time:
+                self._checked = self._end
+                self._next_run()
+            else:
+                self._checked = time
+
+    def _next_run(self):
+        run = next(self._runs, None)
+        if run is None:
+            self._expect = None
+        else:
+            self._expect, count = run
+            self._begin = self._end
+            self._end += count
+
+
+def check(board, inputs, expected, cycles=None):
+    """
+    Drives inputs into a Board and checks its outputs after each cycle,
+    stopping at the first difference.  Returns a VectorResult.
+
+    inputs and expected map GPIO ports, or their 'controller.port'
+    names, to sequences of values: lists, iterators or NumPy arrays.
+    The last input value is held.  The Board is run for as long as the
+    longest expected sequence, or for cycles if given, which it has to
+    be if any expected values are an iterator.
+    """
+    mcs = {i.name: i for i in board._items}
+    ins = [(_port(mcs, p), values) for p, values in inputs.items()]
+    outs = [(_port(mcs, p), values) for p, values in expected.items()]
+    for port, values in ins + outs:
+        if isinstance(port, XBUS):
+            raise TypeError("Only GPIO ports can be driven or checked: "
+                            + port.name)
+    if cycles is None:
+        for port, values in outs:
+            if not hasattr(values, '__len__'):
+                raise TypeError("cycles is needed to check {} against "
+                                "values of unknown length".format(port.name))
+        cycles = max((len(v) for p, v in outs), default=0)
+    start = board.clock.get()
+    stimuli = []
+    for port, values in ins:
+        stim = Stimulus(board, values, name=port.name)
+        stim.link(port)
+        stim.start(start)
+        stimuli.append(stim)
+    checkers = [
+        (port.name, _Checker(board, port, values, start))
+        for port, values in outs
+    ]
+    try:
+        board.run(cycles=cycles)
+    finally:
+        now = board.clock.get()
+        for name, checker in checkers:
+            checker.finish(now)
+        for stim in stimuli:
+            stim.stop()
+            stim.unlink()
+    failed = [(c.failure, name) for name, c in checkers if c.failure]
+    if not failed:
+        return VectorResult(now - start)
+    (time, want, got), name = min(failed, key=lambda f: f[0][0])
+    return VectorResult(
+        now - start, time - start, name, want, got,
+        {i.name: i._cpu._inst_pointer for i in board._items},
+    )
+
+
+def check_many(spec, cases, workers=None, shards=None):
+    """
+    Checks every (inputs, expected) case against its own Board, built
+    from the controllers and links of a BoardSpec, over worker
+    processes.  Port names have to be used.
+
+    Cases are split into shards of consecutive cases, and each shard
+    stops at its first failure.  Results come back in the same order as
+    the cases, up to and including the first failure.
+    """
+    cases = list(cases)
+    if not cases:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if shards is None:
+        shards = workers * 4
+    size = max(1, -(-len(cases) // shards))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_check_shard, spec, cases[n:n + size])
+            for n in range(0, len(cases), size)
+        ]
+        results = []
+        for future in futures:
+            part = future.result()
+            results.extend(part)
+            if not part[-1].passed:
+                for f in futures:
+                    f.cancel()
+                break
+    return results
+
+
+def _check_shard(spec, cases):
+    results = []
+    for inputs, expected in cases:
+        board, mcs = batch.build(spec)
+        results.append(check(board, inputs, expected))
+        if not results[-1].passed:
+            break
+    return results
+
+
+def _port(mcs, port):
+    if isinstance(port, Interface):
+        return port
+    return batch.port(mcs, port)
+
@@ -0,0 +1,250 @@
+"""
+Streams value changes on a Board to disk, for runs too long to keep in
+memory.
+
+    sink = VCDSink(board, 'run.vcd', [mc1.p0, mc1.register('acc'), mc2.x0])
+    sink.start()
+    board.run(cycles=10 ** 8)
+    sink.stop()
+
+VCDSink writes a Value Change Dump that waveform viewers can open, with
+one time unit per cycle.  BinarySink writes fixed width records to a
+memory mapped file, which load() maps back as a NumPy structured array
+without copying.
+
+Ports and registers are looked at after the Board commits each cycle,
+without reading them.  XBus ports show the value waiting to be read, or
+IDLE.  Changes are buffered and written in batches.
+"""
+import json
+import mmap
+import os
+import struct
+from operator import attrgetter
+
+from mcx4.interfaces import Interface, XBUS
+
+IDLE = -1000  # XBus value when nothing is waiting to be read.
+
+# Binary files start with MAGIC, the size of the header and the signal
+# names as JSON, padded so records are aligned.
+MAGIC = b'MCX4WAVE'
+RECORD = struct.Struct('<qii')  # time, signal, value
+
+
+def signal_name(signal):
+    """
+    'mc1.p0' for ports and 'mc1.acc' for registers.
+    """
+    if isinstance(signal, Interface):
+        return signal.name
+    return signal._parent.name+"."+signal._name
+
+
+class Sink():
+
+    """
+    Samples signals after every cycle and writes out the changes.
+    """
+
+    _board = None  # Board
+    _signals = None  # [Interface or Register]
+    _getters = None  # [(signal, function getting its value)]
+    _last = None  # [last value of each signal]
+    _pending = None  # [(time, signal number, value)] not written yet.
+    _batch = 4096  # Changes to gather before writing.
+    _running = False
+
+    def __init__(self, board, signals, batch=4096):
+        if batch < 1:
+            raise ValueError("Batch size must be positive: {}".format(batch))
+        self._board = board
+        self._signals = list(signals)
+        self._getters = [(s, self._getter(s)) for s in self._signals]
+        self._last = [object()] * len(self._signals)  # Never equal.
+        self._pending = []
+        self._batch = batch
+
+    @property
+    def names(self):
+        return [signal_name(s) for s in self._signals]
+
+    def start(self):
+        if self._running:
+            return
+        self._open()
+        self._board._recorders.append(self)
+        self._running = True
+        self.sample(self._board.clock.get())
+
+    def stop(self):
+        """
+        Writes out what's left and closes the file.
+        """
+        if not self._running:
+            return
+        self._board._recorders.remove(self)
+        self._running = False
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample(self, now):
+        last = self._last
+        pending = self._pending
+        n = 0
+        for signal, get in self._getters:
+            val = get(signal)
+            if val != last[n]:
+                last[n] = val
+                pending.append((now, n, IDLE if val is None else val))
+            n += 1
+        if len(pending) >= self._batch:
+            self.flush()
+
+    def _getter(self, signal):
+        if signal.__class__ is XBUS:
+            return attrgetter('_offer')  # None when idle.
+        if isinstance(signal, Interface):
+            return attrgetter('_output')
+        return attrgetter('_val')
+
+    def flush(self):
+        if self._pending:
+            self._write(self._pending)
+            self._pending.clear()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, changes):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class VCDSink(Sink):
+
+    _path = None
+    _file = None
+    _ids = None  # [VCD identifier of each signal]
+    _time = None  # Time of the last change written.
+
+    def __init__(self, board, path, signals, batch=4096):
+        super().__init__(board, signals, batch)
+        self._path = path
+        self._ids = [self._identifier(n) for n in range(len(self._signals))]
+
+    def _identifier(self, n):
+        """
+        Short printable identifier for signal number n.
+        """
+        out = ''
+        while True:
+            n, c = divmod(n, 94)
+            out += chr(33 + c)
+            if n == 0:
+                return out
+            n -= 1
+
+    def _open(self):
+        self._file = open(self._path, 'w')
+        self._time = None
+        out = ["$version mcx4 $end", "$timescale 1 ns $end"]
+        scopes = {}
+        for name, id in zip(self.names, self._ids):
+            part, _, signal = name.rpartition('.')
+            scopes.setdefault(part, []).append((signal, id))
+        for part, signals in scopes.items():
+            out.append("$scope module {} $end".format(part))
+            for signal, id in signals:
+                out.append("$var integer 11 {} {} $end".format(id, signal))
+            out.append("$upscope $end")
+        out.append("$enddefinitions $end")
+        self._file.write("\n".join(out)+"\n")
+
+    def _write(self, changes):
+        ids = self._ids
+        time = self._time
+        out = []
+        for now, n, val in changes:
+            if now != time:
+                time = now
+                out.append("#{}".format(now))
+            # Values are 11 bit two's complement.
+            out.append("b{:b} {}".format(val & 0x7ff, ids[n]))
+        self._time = time
+        self._file.write("\n".join(out)+"\n")
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+
+
+class BinarySink(Sink):
+
+    _path = None
+    _file = None
+    _map = None  # mmap of the file.
+    _offset = 0  # Where the next record goes.
+    _grow = 1 << 20  # Bytes to grow the file by when it's full.
+
+    def __init__(self, board, path, signals, batch=4096):
+        super().__init__(board, signals, batch)
+        self._path = path
+
+    def _open(self):
+        names = json.dumps(self.names).encode('utf-8')
+        size = len(MAGIC) + 4 + len(names)
+        size += -size % RECORD.size
+        header = MAGIC + struct.pack('<I', size) + names
+        self._file = open(self._path, 'w+b')
+        self._file.write(header.ljust(size, b' '))
+        self._offset = size
+        self._file.truncate(size + self._grow)
+        self._map = mmap.mmap(self._file.fileno(), size + self._grow)
+
+    def _write(self, changes):
+        data = b''.join(RECORD.pack(*c) for c in changes)
+        end = self._offset + len(data)
+        if end > len(self._map):
+            size = end + self._grow
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[self._offset:end] = data
+        self._offset = end
+
+    def _close(self):
+        self._map.close()
+        self._map = None
+        self._file.truncate(self._offset)  # Drop the unused space.
+        self._file.close()
+        self._file = None
+
+
+def load(path):
+    """
+    Maps a BinarySink file back without copying.
+
+    Returns (signal names, records), where records is a NumPy structured
+    array with time, signal and value fields.  Requires NumPy.
+    """
+    import numpy as np
+    with open(path, 'rb') as f:
+        head = f.read(len(MAGIC) + 4)
+        if head[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a waveform file: {}".format(path))
+        size, = struct.unpack('<I', head[len(MAGIC):])
+        names = json.loads(f.read(size - len(head)).decode('utf-8'))
+    dtype = np.dtype([('time', '<i8'), ('signal', '<i4'), ('value', '<i4')])
+    if os.path.getsize(path) == size:
+        return names, np.zeros(0, dtype=dtype)
+    return names, np.memmap(path, dtype=dtype, mode='r', offset=size)
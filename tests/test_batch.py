@@ -0,0 +1,88 @@
+import unittest
+
+from mcx4 import batch
+from mcx4.batch import BoardSpec
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional.
+    np = None
+
+
+COUNTER = """
+  add 1
+  mov acc p0
+  slp 1
+"""
+
+READER = """
+  mov p1 acc
+"""
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def spec(self, n):
+        return BoardSpec(
+            controllers={'a': ('MC6000', COUNTER), 'b': ('MC4000', READER)},
+            links=[('a.p0', 'b.p1')],
+            cycles=3000 + n,
+            trace=['a.p0'],
+        )
+
+    def test_run(self):
+        result = batch.run(self.spec(0))
+        self.assertEqual(3000, result.cycles)
+        self.assertEqual(3, result.registers['a']['acc'])
+        self.assertEqual({'acc': 3, 'dat0': 0}, result.registers['a'])
+        self.assertEqual(3, result.registers['b']['acc'])
+        self.assertEqual([(0, 0), (1, 1), (1003, 2), (2005, 3)],
+                         result.traces['a.p0'])
+
+    def test_inputs(self):
+        spec = BoardSpec(
+            controllers={'b': ('MC4000', READER), 'c': ('MC4000', 'nop')},
+            links=[('b.p1', 'c.p0')],
+            cycles=5,
+            inputs={'c.p0': [0, 10, 20]},
+        )
+        result = batch.run(spec)
+        self.assertEqual(20, result.registers['b']['acc'])
+        self.assertEqual(10, result.instructions)
+
+    def test_inputs_own_port(self):
+        for inputs, trace in (({'a.p1': 30}, []), ({'a.p1': [0, 30]}, []),
+                              ({'a.p1': 30}, ['a.p1'])):
+            spec = BoardSpec(
+                controllers={'a': ('MC4000', 'mov p1 acc')},
+                cycles=5,
+                inputs=inputs,
+                trace=trace,
+            )
+            result = batch.run(spec)
+            self.assertEqual(30, result.registers['a']['acc'], inputs)
+
+    @unittest.skipIf(np is None, "NumPy isn't installed.")
+    def test_numpy_inputs(self):
+        for value in (np.int64(30), np.array([0, 30])):
+            spec = BoardSpec(
+                controllers={'a': ('MC4000', 'mov p1 acc')},
+                cycles=5,
+                inputs={'a.p1': value},
+            )
+            self.assertEqual(30, batch.run(spec).registers['a']['acc'])
+
+    def test_unknown_model(self):
+        with self.assertRaises(ValueError):
+            batch.run(BoardSpec({'a': ('Board', 'nop')}))
+
+    def test_simulate_order(self):
+        specs = [self.spec(n) for n in range(6)]
+        results = batch.simulate(specs, workers=2, chunksize=2)
+        self.assertEqual([3000 + n for n in range(6)],
+                         [r.cycles for r in results])
+        local = [batch.run(s) for s in specs]
+        self.assertEqual([r.registers for r in local],
+                         [r.registers for r in results])
+        self.assertEqual([r.traces for r in local],
+                         [r.traces for r in results])
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import run
+from benchmarks.workloads import WORKLOADS
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_workloads_run(self):
+        for workload in WORKLOADS:
+            board = workload.build()
+            cycles, insts = board.run(cycles=20)
+            self.assertEqual(20, cycles, workload.name)
+            self.assertGreater(insts, 0, workload.name)
+
+    def test_measure(self):
+        results = run.run(['arithmetic'], repeat=1, scale=0.01)
+        r = results['results']['arithmetic']
+        self.assertEqual(['arithmetic'], list(results['results']))
+        self.assertGreater(r['insts_per_sec'], 0)
+        self.assertGreater(r['peak_bytes'], 0)
+
+    def test_compare(self):
+        baseline = {'results': {
+            'a': {'insts_per_sec': 100, 'cycles_per_sec': 100,
+                  'peak_bytes': 1000},
+        }}
+        results = {'results': {
+            'a': {'insts_per_sec': 95, 'cycles_per_sec': 80,
+                  'peak_bytes': 1200},
+            'b': {'insts_per_sec': 1, 'cycles_per_sec': 1, 'peak_bytes': 1},
+        }}
+        self.assertEqual([
+            ('a', 'cycles_per_sec', 100, 80),
+            ('a', 'peak_bytes', 1000, 1200),
+        ], run.compare(results, baseline, threshold=0.1))
+        self.assertEqual([], run.compare(results, baseline, threshold=0.5))
+
+    def test_save_load(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'results.json')
+            results = run.run(['digits'], repeat=1, scale=0.01)
+            run.save(results, path)
+            self.assertEqual(results, run.load(path))
+        finally:
+            shutil.rmtree(d)
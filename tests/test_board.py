@@ -1,8 +1,9 @@
 import unittest
 
-from mcx4.microcontrollers import Microcontroller
+from mcx4.microcontrollers import Microcontroller, MC6000
 from mcx4.board import Board
 from mcx4 import time
+from mcx4.time import Clock
 
 import mcx4.exceptions as x
 
@@ -19,20 +20,20 @@ class BoardTestCase(unittest.TestCase):
             slp 1
             mov 100 acc
         """)
-        t = time.get()
+        t = b.clock.get()
         # We need this one so the other doesn't advance to the
         # end of its sleep cycle.
         mc2.compile("nop")
         b.step()
-        self.assertEqual(t + 1, time.get())
+        self.assertEqual(t + 1, b.clock.get())
         b.step()  # mov 0 acc
-        self.assertEqual(t + 2, time.get())
+        self.assertEqual(t + 2, b.clock.get())
         b.step()  # slp 1
-        self.assertEqual(t + 3, time.get())
+        self.assertEqual(t + 3, b.clock.get())
         b.step()  # ...zzz...
-        self.assertEqual(t + 4, time.get())
+        self.assertEqual(t + 4, b.clock.get())
         b.step()  # ...zzz...
-        self.assertEqual(t + 5, time.get())
+        self.assertEqual(t + 5, b.clock.get())
         self.assertEqual(0, mc1.acc)
         b.advance()
         self.assertEqual(100, mc1.acc)
@@ -40,22 +41,58 @@ class BoardTestCase(unittest.TestCase):
     def test_sleep_auto_advance(self):
         b = Board()
         mc1 = Microcontroller('mc1')
-        t = time.get()
+        t = b.clock.get()
         b.add(mc1)
         mc1.compile("""
             slp 1
             mov 100 acc
         """)
-        t = time.get()
+        t = b.clock.get()
         b.step()  # slp 1
-        self.assertEqual(t + 1, time.get())
+        self.assertEqual(t + 1, b.clock.get())
         b.step()  # ... zzz ...
-        self.assertEqual(t + 1001, time.get())
+        self.assertEqual(t + 1001, b.clock.get())
         self.assertEqual(0, mc1.acc)
         b.step()  # mov 100 acc
-        self.assertEqual(t + 1002, time.get())
+        self.assertEqual(t + 1002, b.clock.get())
         self.assertEqual(100, mc1.acc)
 
+    def test_run_in_chunks(self):
+        def state(b, mc):
+            return (b.clock.get(), mc._sleep_until, mc.acc,
+                    mc._cpu._executed)
+
+        for chunks in ([3003], [1001] * 3, [1] * 3003, [999, 2, 2002],
+                       [1000, 1, 1, 2001]):
+            b = Board()
+            mc = MC6000('mc')
+            b.add(mc)
+            mc.compile("""
+                add 1
+                slp 1
+            """)
+            for cycles in chunks:
+                b.run(cycles=cycles)
+            if chunks == [3003]:
+                whole = state(b, mc)
+            self.assertEqual(whole, state(b, mc), chunks)
+
+    def test_step_after_run_to_wake(self):
+        b = Board()
+        mc = MC6000('mc')
+        b.add(mc)
+        mc.compile("""
+            slp 1
+            add 1
+        """)
+        start = b.clock.get()
+        b.run(cycles=1000)  # Ends right on the wake time.
+        b.step()  # The wake cycle was used up already.
+        self.assertEqual(0, mc.acc)
+        b.step()
+        self.assertEqual(1, mc.acc)
+        self.assertEqual(start + 1002, b.clock.get())
+
     def test_step_empty_board(self):
         b = Board()
         b.step()
@@ -99,3 +136,396 @@ class BoardTestCase(unittest.TestCase):
         b.step()
         self.assertEqual(100, mc2.p0.output)
         self.assertEqual(100, mc1.acc)
+
+    def test_sleepers_not_stepped(self):
+        b = Board()
+        busy = Microcontroller('busy')
+        busy.compile("add 1")
+        sleepers = []
+        for n in range(50):
+            mc = Microcontroller()
+            mc.compile("""
+                slp 2
+                add 1
+            """)
+            sleepers.append(mc)
+            b.add(mc)
+        b.add(busy)
+        b.step()  # Everyone runs once; sleepers go to sleep.
+        b.step()
+        self.assertEqual([busy], b._active)
+        self.assertEqual(2, busy.acc)
+        self.assertEqual(50, len(b._sleepers))
+        while b.clock.get() < sleepers[0]._sleep_until:
+            b.step()
+        self.assertEqual(0, sleepers[0].acc)
+        b.step()  # Everyone wakes up and adds.
+        self.assertEqual([1] * 50, [mc.acc for mc in sleepers])
+        self.assertEqual(b._items, b._active)
+
+    def test_wake_order(self):
+        b = Board()
+        mcs = []
+        for n in range(3):
+            mc = Microcontroller()
+            mc.compile("nop")
+            mcs.append(mc)
+            b.add(mc)
+        for n, mc in enumerate(reversed(mcs)):
+            mc.sleep(n + 1)
+        end = mcs[0]._sleep_until
+        b.step()
+        self.assertEqual([], b._active)
+        while b.clock.get() <= end:
+            b.step()
+        self.assertEqual(mcs, b._active)
+
+    def test_run_cycles(self):
+        b = Board()
+        mc = Microcontroller()
+        b.add(mc)
+        mc.compile("add 1")
+        t = b.clock.get()
+        self.assertEqual((500, 500), b.run(cycles=500))
+        self.assertEqual(t + 500, b.clock.get())
+        self.assertEqual(500, mc.acc)
+
+    def test_run_until(self):
+        b = Board()
+        mc1 = Microcontroller(gpio=1)
+        mc2 = Microcontroller(gpio=1)
+        b.add(mc1)
+        b.add(mc2)
+        mc1.p0.link(mc2.p0)
+        mc1.compile("""
+            add 10
+            mov acc p0
+        """)
+        cycles, insts = b.run(until=lambda b: mc2.p0.read() >= 50)
+        self.assertEqual(10, cycles)
+        self.assertEqual(10, insts)  # mc2 has no program.
+        self.assertEqual(50, mc1.p0.output)
+
+    def test_run_matches_step(self):
+        code = """
+            add 1
+            slp 1
+        """
+        b1 = Board()
+        mc1 = Microcontroller()
+        b1.add(mc1)
+        mc1.compile(code)
+        t = b1.clock.get()
+        while b1.clock.get() < t + 5000:
+            b1.step()
+        b2 = Board()
+        mc2 = Microcontroller()
+        b2.add(mc2)
+        mc2.compile(code)
+        cycles, insts = b2.run(cycles=5000)
+        self.assertEqual(5000, cycles)
+        self.assertEqual(mc1.acc, mc2.acc)
+        self.assertEqual(10, insts)
+
+    def test_run_atus_stops_on_time(self):
+        b = Board()
+        mc = Microcontroller()
+        b.add(mc)
+        mc.compile("slp 5")
+        t = b.clock.get()
+        self.assertEqual((1000, 1), b.run(atus=1))
+        self.assertEqual(t + 1000, b.clock.get())
+
+    def test_wake_at_zero(self):
+        b = Board()
+        mc = Microcontroller()
+        b.add(mc)
+        mc.compile("add 1")
+        b.clock.set(1000)
+        mc.sleep(-1)  # Wakes at cycle 0.
+        self.assertEqual(0, mc._sleep_until)
+        b.step()
+        b.step()
+        self.assertEqual([mc], b._active)
+        self.assertEqual(2, mc.acc)
+
+    def test_independent_clocks(self):
+        b1 = Board()
+        b2 = Board()
+        mc1 = Microcontroller()
+        mc2 = Microcontroller()
+        b1.add(mc1)
+        b2.add(mc2)
+        mc1.compile("slp 1")
+        t = time.get()
+        b1.run(cycles=10)
+        b2.run(cycles=3)
+        self.assertEqual(11, b1.clock.get())
+        self.assertEqual(4, b2.clock.get())
+        self.assertEqual(1001, mc1._sleep_until)
+        self.assertEqual(t, time.get())  # Default clock untouched.
+
+    def test_module_cycles_per_ATU(self):
+        saved = time._cycles_per_ATU
+        time._cycles_per_ATU = 10
+        try:
+            b = Board()
+            self.assertEqual(10, b.clock.cycles_per_ATU)
+            self.assertEqual(7, Clock(cycles_per_ATU=7).cycles_per_ATU)
+        finally:
+            time._cycles_per_ATU = saved
+        self.assertEqual(saved, b.clock.cycles_per_ATU)
+
+    def test_sleep_off_board(self):
+        mc = MC6000()
+        mc.execute("slp 1")
+        self.assertFalse(mc.sleeping())
+
+    def test_shared_clock(self):
+        clock = Clock(100)
+        b = Board(clock)
+        self.assertIs(clock, b.clock)
+        b.add(Microcontroller())
+        b.step()
+        self.assertEqual(101, clock.get())
+
+    def test_writes_commit_at_end_of_cycle(self):
+        b = Board()
+        mc1 = Microcontroller(gpio=1)
+        mc2 = Microcontroller(gpio=1)
+        b.add(mc1)
+        b.add(mc2)
+        mc1.p0.link(mc2.p0)
+        mc1.p0.write(30)  # From outside, between cycles.
+        self.assertEqual(0, mc1.p0.output)
+        self.assertEqual([mc1.p0], b._writes)
+        mc1.p0.write(40)  # Replaces the buffered write.
+        self.assertEqual([mc1.p0], b._writes)
+        b.step()
+        self.assertEqual([], b._writes)
+        self.assertEqual(40, mc1.p0.output)
+        self.assertEqual(40, mc2.p0.read())
+
+    def periodic_board(self):
+        b = Board()
+        mc1 = Microcontroller(gpio=1)
+        mc2 = Microcontroller(gpio=1, dats=1)
+        b.add(mc1)
+        b.add(mc2)
+        mc1.p0.link(mc2.p0)
+        mc1.compile("""
+            add 1
+            tgt acc 2
+          + mov 0 acc
+            mul 50
+            mov acc p0
+            slp 1
+        """)
+        mc2.compile("""
+            mov p0 dat
+            add dat
+            dgt 1
+            nop
+        """)
+        return b, mc1, mc2
+
+    def test_fast_forward(self):
+        expected = []
+        for ff in (0, 64):
+            b, mc1, mc2 = self.periodic_board()
+            b.fast_forward(ff)
+            cycles, insts = b.run(cycles=1234567)
+            expected.append((
+                cycles, insts, b.clock.get(),
+                mc1.acc, mc2.acc, mc2.dat.read(), mc1.p0.output,
+                mc1._cpu._inst_pointer, mc2._cpu._inst_pointer,
+                mc1._sleep_until,
+            ))
+        self.assertEqual(expected[0], expected[1])
+
+    def test_fast_forward_skips(self):
+        b, mc1, mc2 = self.periodic_board()
+        b.fast_forward(100)
+        b.run(cycles=10 ** 7)
+        # Only a few periods were actually simulated.
+        self.assertLess(mc2._cpu._executed, 100000)
+
+    def test_fast_forward_subscribed(self):
+        b = Board()
+        mc = MC6000('mc')
+        b.add(mc)
+        mc.compile("""
+            mov 100 p0
+            mov 0 p0
+        """)
+        changes = []
+        mc.p0.subscribe(lambda cycle, value: changes.append(value))
+        b.fast_forward(16)
+        b.run(cycles=2000)
+        self.assertEqual(2000, len(changes))
+
+    def xbus_board(self, readers=1):
+        b = Board()
+        writer = MC6000('writer')
+        b.add(writer)
+        parts = []
+        for n in range(readers):
+            mc = MC6000('reader{}'.format(n))
+            b.add(mc)
+            writer.x0.link(mc.x0)
+            parts.append(mc)
+        return b, writer, parts
+
+    def test_xbus_blocking(self):
+        b, writer, (reader,) = self.xbus_board()
+        writer.compile("""
+            add 1
+            mov acc x0
+        """)
+        reader.compile("""
+            mov x0 dat
+            add dat
+        """)
+        b.step()  # add 1 / blocked reading x0
+        self.assertTrue(reader._blocked)
+        b.step()  # mov acc x0 / parked
+        self.assertTrue(writer._blocked)
+        b.step()  # Waiting for the reader / mov x0 dat
+        self.assertEqual(1, reader.dat.read())
+        self.assertFalse(writer._blocked)
+        b.step()  # add 1 / add dat
+        self.assertEqual((2, 1), (writer.acc, reader.acc))
+        b.run(cycles=100, until=lambda b: writer.acc == 10)
+        self.assertEqual(sum(range(10)), reader.acc)
+
+    def test_slx(self):
+        b, writer, (reader,) = self.xbus_board()
+        writer.compile("""
+            slp 2
+            mov 7 x0
+        """)
+        reader.compile("""
+            slx x0
+            add 1
+            mov x0 null
+        """)
+        b.run(cycles=1000)
+        self.assertTrue(reader._blocked)
+        self.assertEqual(0, reader.acc)
+        b.run(cycles=2000)
+        self.assertEqual(1, reader.acc)
+        self.assertTrue(reader._blocked)  # Back on slx.
+
+    def test_two_xbus_reads(self):
+        b = Board()
+        reader = MC6000('reader')
+        first = MC6000('first')
+        second = MC6000('second')
+        for mc in (reader, first, second):
+            b.add(mc)
+        reader.x0.link(first.x0)
+        reader.x1.link(second.x0)
+        reader.compile("""
+            teq x0 x1
+        +   mov 1 dat
+            slp 10
+        """)
+        first.compile("mov 7 x0")
+        second.compile("""
+            slp 1
+            mov 7 x0
+        """)
+        b.run(cycles=3000)
+        self.assertEqual(1, reader.dat.read())
+
+    def test_execute_blocked(self):
+        b, writer, (reader,) = self.xbus_board()
+        with self.assertRaises(x.BlockedException):
+            reader.execute("mov x0 acc")
+
+    def test_slx_needs_xbus(self):
+        mc = MC6000()
+        with self.assertRaises(x.CommandException):
+            mc.compile("slx p0")
+
+    def test_xbus_waiters_not_stepped(self):
+        b, writer, readers = self.xbus_board(readers=3)
+        writer.compile("""
+            slp 5
+            mov 1 x0
+        """)
+        for mc in readers:
+            mc.compile("""
+                add x0
+                slp 100
+            """)
+        b.run(cycles=1000)
+        # Each reader only tried to read once before the write.
+        self.assertEqual([0, 0, 0], [mc._cpu._executed for mc in readers])
+        b.run(cycles=5000)
+        self.assertEqual(1, sum(mc.acc for mc in readers))
+        self.assertEqual(1, readers[0].acc)  # In the order they were added.
+
+    def test_snapshot_restore(self):
+        b, writer, (reader,) = self.xbus_board()
+        writer.compile("""
+            add 1
+            mov acc p0
+            teq acc 3
+          + slp 1
+            mov acc x0
+        """)
+        reader.compile("""
+            slx x0
+            mov x0 dat
+            add dat
+            mov acc p1
+        """)
+        b.run(cycles=7)
+        snap = b.snapshot()
+        b.run(cycles=5000)
+        after = b.snapshot()
+        insts = b.executed()
+        b.restore(snap)
+        self.assertEqual(snap, b.snapshot())
+        b.run(cycles=5000)
+        self.assertEqual(after, b.snapshot())
+        self.assertEqual(insts, b.executed())
+        # Restoring more than once explores from the same point.
+        b.restore(snap)
+        writer.p0.write(0)
+        b.run(cycles=5000)
+        self.assertEqual(after, b.snapshot())
+
+    def test_snapshot_sleeping(self):
+        b, mc1, mc2 = self.periodic_board()
+        b.run(cycles=1500)
+        snap = b.snapshot()
+        self.assertIsNotNone(mc1._sleep_until)
+        b.run(cycles=2000)
+        acc = (mc1.acc, mc2.acc, b.clock.get())
+        b.restore(snap)
+        b.run(cycles=2000)
+        self.assertEqual(acc, (mc1.acc, mc2.acc, b.clock.get()))
+
+    def test_snapshot_on_wake_time(self):
+        b = Board()
+        mc = MC6000('mc')
+        b.add(mc)
+        mc.compile("""
+            add 1
+            slp 1
+        """)
+        b.run(cycles=1001)  # Ends right on the wake time.
+        snap = b.snapshot()
+        b.run(cycles=1000)
+        after = (mc.acc, mc._sleep_until)
+        b.restore(snap)
+        b.run(cycles=1000)
+        self.assertEqual(after, (mc.acc, mc._sleep_until))
+
+    def test_restore_other_board(self):
+        b, writer, readers = self.xbus_board(readers=2)
+        other, *rest = self.xbus_board()
+        with self.assertRaises(ValueError):
+            other.restore(b.snapshot())
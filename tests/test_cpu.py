@@ -1,8 +1,10 @@
+import random
 import unittest
 
-from mcx4.microcontrollers import Microcontroller
-from mcx4.interfaces import Register
+from mcx4.microcontrollers import Microcontroller, MC4000, MC6000
+from mcx4.interfaces import Register, Literal
 from mcx4.cpus import CPU
+from mcx4 import cpus
 import mcx4.exceptions as x
 
 class CPUTestCase(unittest.TestCase):
@@ -63,7 +65,7 @@ class CPUTestCase(unittest.TestCase):
         self.assertEqual(967, mc.acc)
         mc.register('acc').write(567)
         mc.execute('dst 3 9')
-        self.assertEqual(0, mc.acc)
+        self.assertEqual(567, mc.acc)
 
     def test_nop(self):
         mc = Microcontroller()
@@ -275,3 +277,300 @@ class CPUTestCase(unittest.TestCase):
             # :)
         """)
         mc1.step()
+
+    def test_decoded_program(self):
+        mc = Microcontroller()
+        mc.compile("""
+          teq acc 0
+        + add 1
+        - sub 1
+        """)
+        program = mc._cpu._program
+        self.assertEqual([cpus.TEQ, cpus.ADD, cpus.SUB],
+                         [inst[0] for inst in program])
+        self.assertEqual([cpus.ALWAYS, cpus.PLUS, cpus.MINUS],
+                         [inst[1] for inst in program])
+        mc.step()
+        mc.step()
+        mc.step()
+        self.assertEqual(1, mc.acc)
+
+    def test_conditional_test(self):
+        code = """
+          teq acc 0
+        + tgt acc 1
+        + mov 5 acc
+        - mov 7 acc
+        """
+        mc = Microcontroller()
+        mc.execute(code)
+        self.assertEqual(7, mc.acc)
+
+    def test_bad_operands(self):
+        mc = Microcontroller()
+        with self.assertRaises(x.CommandException):
+            mc.compile('add')
+        with self.assertRaises(x.CommandException):
+            mc.compile('mov 1 acc 2')
+        with self.assertRaises(x.CommandException):
+            mc.compile('tzz acc 1')
+
+    def test_compile_time_operands(self):
+        mc = Microcontroller(gpio=1, dats=1)
+        mc.compile("""
+          mov 5 acc
+          mov acc dat
+          mov dat p0
+        """)
+        program = mc._cpu._program
+        self.assertIsInstance(program[0][3][0], Literal)
+        self.assertIs(mc.register('acc'), program[0][3][1])
+        self.assertIs(mc.dat, program[1][3][1])
+        self.assertIs(mc.p0, program[2][3][1])
+
+    def test_compile_bad_operands(self):
+        mc = Microcontroller(gpio=1)
+        with self.assertRaises(x.RegisterException):
+            mc.compile('mov 1 dat')
+        with self.assertRaises(x.RegisterException):
+            mc.compile('add foo')
+        with self.assertRaises(x.RegisterException):
+            mc.compile('mov acc 5')
+        with self.assertRaises(x.PortException):
+            mc.compile('mov 1 p3')
+
+    def test_dgt_negative(self):
+        mc = Microcontroller()
+        for bit, expected in ((0, -7), (1, -6), (2, -5), (3, 0)):
+            mc.register('acc').write(-567)
+            mc.execute('dgt {}'.format(bit))
+            self.assertEqual(expected, mc.acc)
+
+    def test_dst_negative(self):
+        mc = Microcontroller()
+        mc.register('acc').write(-567)
+        mc.execute('dst 0 9')
+        self.assertEqual(-569, mc.acc)
+        mc.register('acc').write(-567)
+        mc.execute('dst 2 -1')
+        self.assertEqual(-167, mc.acc)
+        mc.register('acc').write(5)
+        mc.execute('dst 2 9')
+        self.assertEqual(905, mc.acc)
+
+    def test_saturation(self):
+        mc = Microcontroller()
+        mc.execute('mov 999 acc\nadd 1')
+        self.assertEqual(999, mc.acc)
+        mc.execute('mov -999 acc\nsub 5')
+        self.assertEqual(-999, mc.acc)
+        mc.execute('mov 500 acc\nmul 3')
+        self.assertEqual(999, mc.acc)
+        acc = mc.register('acc')
+        acc.inc(5)
+        self.assertEqual(999, acc.read())
+        acc.dec(3)
+        self.assertEqual(996, acc.read())
+        acc.write(-998)
+        acc.dec(5)
+        self.assertEqual(-999, acc.read())
+
+    def test_program_cache(self):
+        code = """
+        a:add 1
+          jmp a
+        """
+        cpus.programs.clear()
+        mc1 = MC6000()
+        mc2 = MC6000()
+        mc1.compile(code)
+        mc2.compile(code)
+        self.assertEqual(1, cpus.programs.misses)
+        self.assertEqual(1, cpus.programs.hits)
+        # Shared templates, but each CPU binds its own registers.
+        self.assertIs(mc1.register('acc'), mc1._cpu._program[0][3][0])
+        self.assertIs(mc2.register('acc'), mc2._cpu._program[0][3][0])
+        mc1.step()
+        self.assertEqual(1, mc1.acc)
+        self.assertEqual(0, mc2.acc)
+        # Different models don't share.
+        MC4000().compile(code)
+        self.assertEqual(2, cpus.programs.misses)
+
+    def test_program_cache_eviction(self):
+        cache = cpus.ProgramCache(size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        cache.resize(1)
+        self.assertEqual(1, len(cache))
+        cache.resize(0)
+        self.assertEqual(0, len(cache))
+        with self.assertRaises(ValueError):
+            cache.resize(-1)
+        with self.assertRaises(ValueError):
+            cpus.ProgramCache(size=-1)
+
+    def test_exec_inst_condition(self):
+        mc = Microcontroller()
+        cpu = mc._cpu
+        cpu.exec_inst(('cond', True, ('mov', '5', 'acc')))
+        self.assertEqual(0, mc.acc)
+        cpu.exec_inst(('cond', False, ('mov', '5', 'acc')))
+        self.assertEqual(0, mc.acc)
+        cpu.exec_inst(('test', 'eq', ('acc', '0')))
+        cpu.exec_inst(('cond', True, ('mov', '5', 'acc')))
+        self.assertEqual(5, mc.acc)
+
+    def test_labels_resolved(self):
+        mc = Microcontroller()
+        mc.compile("a: add 1\njmp a")
+        self.assertEqual((0,), mc._cpu._program[1][3])
+        with self.assertRaises(x.LabelException):
+            mc.compile("jmp nowhere")
+
+    def test_label_numbers(self):
+        mc = Microcontroller()
+        mc.compile("""
+              add 1  ; Comments and blank lines don't count.
+
+        b:    add 2
+        c:
+              jmp b
+        """)
+        self.assertEqual({'b': 1, 'c': 2}, dict(mc._cpu._labels))
+        self.assertEqual((1,), mc._cpu._program[2][3])
+
+
+def random_program(rnd, size=10):
+    """
+    Random code that only jumps forwards, so it always finishes.
+    """
+    reads = ['acc', 'dat', 'null', '0', '1', '2', '5', '-4', '1500']
+    lines = []
+    for n in range(size):
+        r = lambda: rnd.choice(reads)
+        inst = rnd.choice([
+            'nop', 'mov {} {}'.format(r(), rnd.choice(['acc', 'dat', 'null'])),
+            'add {}'.format(r()), 'mul {}'.format(r()), 'not',
+            'dgt {}'.format(r()), 'dst {} {}'.format(r(), r()),
+            'teq {} {}'.format(r(), r()), 'tgt {} {}'.format(r(), r()),
+            'tcp {} {}'.format(r(), r()), 'tlt acc acc',
+            'jmp l{}'.format(rnd.randint(n + 1, size)),
+        ])
+        if rnd.random() < 0.4:
+            inst = rnd.choice('+-')+' '+inst
+        lines.append('l{}: {}'.format(n, inst))
+    lines.append('l{}:'.format(size))
+    return "\n".join(lines)
+
+
+class OptimizerTestCase(unittest.TestCase):
+
+    def ops(self, mc):
+        return [(op, cond) for op, cond, handler, args in mc._cpu._program]
+
+    def test_fold_tests(self):
+        mc = MC6000()
+        mc.compile("""
+            teq 1 1
+          + add 1
+          - add 2
+            tgt acc acc
+          - add 3
+            tlt acc 1
+          + add 4
+        """)
+        self.assertEqual([
+            (cpus.FLG, cpus.ALWAYS), (cpus.ADD, cpus.ALWAYS),
+            (cpus.NOP, cpus.ALWAYS), (cpus.FLG, cpus.ALWAYS),
+            (cpus.ADD, cpus.ALWAYS), (cpus.TLT, cpus.ALWAYS),
+            (cpus.ADD, cpus.PLUS),
+        ], self.ops(mc))
+        self.assertEqual((True, False), mc._cpu._program[0][3])
+
+    def test_jump_target_flags_unknown(self):
+        mc = MC6000()
+        mc.compile("""
+               teq 1 1
+            a: + add 1
+               teq 1 2
+               jmp a
+        """)
+        self.assertEqual(cpus.PLUS, mc._cpu._program[1][1])
+
+    def test_null_writes(self):
+        mc = MC6000()
+        mc.compile("""
+            mov 5 null
+            mov acc null
+            mov p0 null
+        """)
+        self.assertEqual(
+            [cpus.NOP, cpus.NOP, cpus.MOV], [op for op, c in self.ops(mc)])
+
+    def test_levels(self):
+        code = """
+            nop
+            mov 3 null
+            add 1
+            jmp next
+        next: add 2
+        """
+        mc = MC6000()
+        mc.compile(code, cpus.NONE)
+        self.assertEqual(5, len(mc._cpu._program))
+        mc.compile(code, cpus.SPEED)
+        self.assertEqual([cpus.ADD, cpus.ADD], [op for op, c in self.ops(mc)])
+        self.assertEqual([4, 6], [n for n, s in mc._cpu._lines])
+        self.assertEqual(1, mc._cpu._labels['next'])
+        mc.execute(code)
+        self.assertEqual(3, mc.acc)
+        self.assertEqual(2, mc._cpu._executed)
+
+    def test_unreachable(self):
+        mc = MC6000()
+        mc.compile("""
+        a:  add 1
+            jmp a
+            add 2
+        """)
+        self.assertEqual((4,), mc._cpu.unreachable())
+        mc.compile("x: add 1\n+ jmp x\nadd 2")
+        self.assertEqual((), mc._cpu.unreachable())
+
+    def test_cycles_preserved(self):
+        rnd = random.Random(7)
+        for n in range(100):
+            code = random_program(rnd)
+            mcs = [MC6000('a'), MC6000('b')]
+            mcs[0].compile(code, cpus.NONE)
+            mcs[1].compile(code, cpus.CYCLES)
+            for cycle in range(30):
+                for mc in mcs:
+                    mc._cpu.step()
+                self.assertEqual(*[
+                    ([r._val for r in mc._registers], mc._cpu._exec_plus,
+                     mc._cpu._exec_minus, mc._cpu._inst_pointer)
+                    for mc in mcs
+                ], msg=code)
+
+    def test_speed_matches(self):
+        rnd = random.Random(8)
+        for n in range(200):
+            code = random_program(rnd)
+            mcs = [MC6000('a'), MC6000('b')]
+            mcs[0].compile(code, cpus.NONE)
+            cpu = mcs[0]._cpu
+            while cpu._inst_pointer < len(cpu._program):
+                cpu.step(loop=False)
+            mcs[1].execute(code)
+            self.assertEqual(*[
+                ([r._val for r in mc._registers], mc._cpu._exec_plus,
+                 mc._cpu._exec_minus) for mc in mcs
+            ], msg=code)
+            self.assertLessEqual(mcs[1]._cpu._executed, cpu._executed)
@@ -1,7 +1,11 @@
+import queue
 import unittest
 
+from mcx4.board import Board
 from mcx4.microcontrollers import Microcontroller
-from mcx4.interfaces import GPIO, XBUS, Register, Interface
+from mcx4.interfaces import (
+    GPIO, XBUS, Register, Interface, Circuit, WatchedCircuit
+)
 
 import mcx4.exceptions as x
 
@@ -58,3 +62,84 @@ class InterfaceTestCase(unittest.TestCase):
         mc3.p0.link(mc1.p0)
         mc3.p0.write(22)
         self.assertEqual(22, mc2.p0.read())
+
+    def test_circuit_value_cached(self):
+        sensor = Microcontroller(name="sensor", gpio=1)
+        readers = [Microcontroller(gpio=1) for n in range(30)]
+        for mc in readers:
+            sensor.p0.link(mc.p0)
+        c = sensor.p0._circuit
+        recomputes = c.recomputes
+        sensor.p0.write(40)
+        for mc in readers[1:]:
+            self.assertEqual(40, mc.p0.read())
+        readers[0].p0.write(70)
+        self.assertEqual(70, readers[1].p0.read())
+        self.assertEqual(recomputes, c.recomputes)
+        self.assertGreater(c.avoided, 0)
+        readers[0].p0.write(10)  # The maximum went down.
+        self.assertEqual(40, readers[1].p0.read())
+        self.assertEqual(recomputes + 1, c.recomputes)
+
+    def test_xbus_read_write(self):
+        mc1 = Microcontroller(name="mc1", xbus=1)
+        mc2 = Microcontroller(name="mc2", xbus=1)
+        mc1.x0.link(mc2.x0)
+        with self.assertRaises(x.RunException):
+            mc2.x0.read()  # Nothing written; off a board it can't wait.
+        mc1.x0.write(5000)
+        self.assertEqual(999, mc2.x0.read())
+        mc1.x0.write(-3)
+        mc1.x0.write(7)  # Replaces the value that wasn't read.
+        self.assertEqual(7, mc2.x0.read())
+        with self.assertRaises(x.RunException):
+            mc2.x0.read()  # Values are only read once.
+
+    def test_subscribe(self):
+        b = Board()
+        mc1 = Microcontroller(name="mc1", gpio=1)
+        mc2 = Microcontroller(name="mc2", gpio=1)
+        b.add(mc1)
+        b.add(mc2)
+        mc1.p0.link(mc2.p0)
+        mc1.compile("""
+            mov 50 p0
+            mov 50 p0
+            mov 0 p0
+        """)
+        start = b.clock.get()
+        seen = []
+        mc2.p0.subscribe(lambda cycle, value: seen.append((cycle, value)))
+        self.assertIs(WatchedCircuit, mc1.p0._circuit.__class__)
+        b.run(cycles=6)
+        self.assertEqual([
+            (start, 50), (start + 2, 0), (start + 3, 50), (start + 5, 0),
+        ], seen)
+        self.assertEqual(0, mc1.p0.output)  # Nothing was read.
+
+    def test_subscribe_queue(self):
+        mc1 = Microcontroller(name="mc1", gpio=1)
+        mc2 = Microcontroller(name="mc2", gpio=1)
+        values = queue.Queue()
+        mc1.p0.subscribe(values)  # Not linked yet.
+        mc1.p0.link(mc2.p0)
+        mc2.p0.write(30)
+        mc2.p0.write(30)
+        mc1.p0.write(10)
+        self.assertEqual([30], [values.get_nowait()[1]
+                                for n in range(values.qsize())])
+        mc1.p0.unsubscribe(values)
+        self.assertIs(Circuit, mc1.p0._circuit.__class__)
+        mc2.p0.write(0)
+        self.assertTrue(values.empty())
+
+    def test_subscribe_xbus(self):
+        mc1 = Microcontroller(name="mc1", xbus=1)
+        mc2 = Microcontroller(name="mc2", xbus=1)
+        mc1.x0.link(mc2.x0)
+        seen = []
+        mc1.x0.subscribe(lambda cycle, value: seen.append(value))
+        mc1.x0.write(5)
+        self.assertEqual([], seen)
+        mc2.x0.read()
+        self.assertEqual([5], seen)
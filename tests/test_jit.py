@@ -0,0 +1,173 @@
+import random
+import unittest
+
+from mcx4 import jit
+from mcx4.board import Board
+from mcx4.microcontrollers import MC4000, MC6000
+from mcx4.profiler import Profiler
+
+import mcx4.exceptions as x
+
+
+READS = ['acc', 'dat', 'null', 'p0', 'p1', '0', '1', '2', '3', '-1', '7',
+         '55', '-300', '998', '1500', '-1500']
+WRITES = ['acc', 'dat', 'null', 'p0', 'p1']
+
+
+def random_program(rnd, looping=True, size=12):
+    lines = []
+    for n in range(size):
+        r = lambda: rnd.choice(READS)
+        inst = rnd.choice([
+            'nop', 'mov {} {}'.format(r(), rnd.choice(WRITES)),
+            'add {}'.format(r()), 'sub {}'.format(r()),
+            'mul {}'.format(r()), 'not',
+            'dgt {}'.format(r()), 'dst {} {}'.format(r(), r()),
+            'teq {} {}'.format(r(), r()), 'tcp {} {}'.format(r(), r()),
+            'tgt {} {}'.format(r(), r()), 'tlt {} {}'.format(r(), r()),
+            'slp {}'.format(rnd.choice(['0', '1', 'p1'])),
+            'jmp start',
+        ][:None if looping else -2])  # Sleeping needs a Board.
+        if rnd.random() < 0.3:
+            inst = rnd.choice('+-')+' '+inst
+        lines.append(inst)
+    lines[0] = 'start: '+lines[0]
+    return "\n".join(lines)
+
+
+class JITTestCase(unittest.TestCase):
+
+    def board(self, code, generated):
+        b = Board()
+        mc = MC6000('mc')
+        driver = MC4000('driver')
+        b.add(mc)
+        b.add(driver)
+        mc.p0.link(driver.p0)
+        mc.p1.link(driver.p1)
+        mc.compile(code)
+        driver.compile("""
+            add 17
+            mov acc p0
+            dgt 0
+            mov acc p1
+            mov 0 p0
+        """)
+        if generated:
+            jit.enable(mc)
+        return b
+
+    def test_step_matches_cpu(self):
+        rnd = random.Random(4)
+        for n in range(60):
+            code = random_program(rnd)
+            boards = [self.board(code, g) for g in (False, True)]
+            for cycle in range(20):
+                cycles = rnd.choice([1, 7, 300])
+                for b in boards:
+                    b.run(cycles=cycles)
+                self.assertEqual(
+                    boards[0].snapshot(), boards[1].snapshot(), code)
+
+    def test_execute_matches_cpu(self):
+        rnd = random.Random(5)
+        for n in range(200):
+            code = random_program(rnd, looping=False)
+            mcs = [MC6000('a'), MC6000('b')]
+            for mc in mcs:
+                mc.register('acc').write(rnd.randint(-999, 999))
+            mcs[1].register('acc').write(mcs[0].acc)
+            mcs[0].execute(code)
+            jit.execute(mcs[1], code)
+            self.assertEqual(
+                *[([r._val for r in mc._registers], mc._cpu._exec_plus,
+                   mc._cpu._exec_minus, mc._cpu._executed) for mc in mcs])
+
+    def test_execute_jump(self):
+        mc = MC6000()
+        jit.execute(mc, """
+            start: add 1
+                   teq acc 5
+                 - jmp start
+                   mov acc dat
+        """)
+        self.assertEqual((5, 5), (mc.acc, mc.dat.read()))
+        self.assertEqual(0, mc._cpu._inst_pointer)
+        self.assertEqual(4 * 3 + 4, mc._cpu._executed)
+
+    def test_recompile(self):
+        b = Board()
+        mc = MC6000()
+        b.add(mc)
+        mc.compile("add 1")
+        jit.enable(mc)
+        b.run(cycles=3)
+        mc.compile("sub 1")
+        b.run(cycles=5)
+        self.assertEqual(-2, mc.acc)
+        jit.disable(mc)
+        self.assertEqual(mc._cpu.step, mc._cpu._stepper)
+
+    def test_cached(self):
+        mcs = [MC6000(), MC6000()]
+        for mc in mcs:
+            mc.compile("add 2\nmov acc p0")
+        jit.enable(mcs[0])
+        misses = jit.generated.misses
+        jit.enable(mcs[1])
+        self.assertEqual(misses, jit.generated.misses)
+
+    def test_xbus_blocking(self):
+        snaps = []
+        for generated in (False, True):
+            b = Board()
+            writer = MC6000('writer')
+            reader = MC6000('reader')
+            b.add(writer)
+            b.add(reader)
+            writer.x0.link(reader.x0)
+            writer.compile("add 1\nmov acc x0")
+            reader.compile("slx x0\nmov x0 dat\nadd dat")
+            if generated:
+                jit.enable(reader)
+            b.run(cycles=40)
+            snaps.append(b.snapshot())
+        self.assertEqual(snaps[0], snaps[1])
+        with self.assertRaises(x.RunException):
+            jit.execute(MC6000(), "mov x0 acc")
+
+    def test_two_xbus_reads(self):
+        snaps = []
+        for generated in (False, True):
+            b = Board()
+            reader = MC6000('reader')
+            first = MC6000('first')
+            second = MC6000('second')
+            for mc in (reader, first, second):
+                b.add(mc)
+            reader.x0.link(first.x0)
+            reader.x1.link(second.x0)
+            reader.compile("add x0\nsub x1\nteq x0 x1\n+ add 100")
+            first.compile("mov 7 x0")
+            second.compile("slp 1\nmov 7 x0")
+            if generated:
+                jit.enable(reader)
+            b.run(cycles=5000)
+            snaps.append(b.snapshot())
+        self.assertEqual(snaps[0], snaps[1])
+        self.assertEqual(207, reader.acc)
+
+    def test_profiled(self):
+        b = Board()
+        mc = MC6000('mc')
+        b.add(mc)
+        mc.compile("add 1\nmov acc p0")
+        jit.enable(mc)
+        generated = mc._cpu._stepper
+        profiler = Profiler(b)
+        profiler.start()
+        b.run(cycles=10)
+        profiler.stop()
+        self.assertIs(generated, mc._cpu._stepper)
+        self.assertEqual([5, 5], [n for line, source, n, taken, skipped
+                                  in profiler.lines(mc)])
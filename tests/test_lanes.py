@@ -0,0 +1,103 @@
+import random
+import unittest
+
+from mcx4.board import Board
+from mcx4.microcontrollers import Microcontroller, MC4000, MC6000
+
+try:
+    import numpy as np
+    from mcx4.lanes import Lanes
+except ImportError:  # NumPy is optional.
+    np = None
+
+import mcx4.exceptions as x
+
+
+PROGRAMS = [
+    (MC4000, """
+        mov p0 acc
+        dgt 1
+        mul 7
+        mov acc p1
+    """),
+    (MC6000, """
+        teq p0 50
+      + add 10
+      - sub 3
+        tcp acc dat
+      + mov acc dat
+      - dst 2 p1
+        tlt acc -20
+      + not
+        tgt acc 900
+      + slp 1
+    """),
+    (MC6000, """
+      a:mov p0 dat
+        add dat
+        tgt acc 300
+      - jmp a
+        mov acc p1
+        mov 0 acc
+        slp 0
+    """),
+    (MC4000, """
+        mov p0 p1
+        add p1
+        mov acc p1
+        tgt acc 500
+      + mov 0 acc
+    """),
+]
+
+
+@unittest.skipIf(np is None, "NumPy isn't installed.")
+class LanesTestCase(unittest.TestCase):
+
+    def scalar(self, model, code, cycles, inputs):
+        """
+        One lane, the slow way.
+        """
+        b = Board()
+        mc = model()
+        b.add(mc)
+        mc.compile(code)
+        for name, val in inputs.items():
+            driver = Microcontroller(gpio=1)
+            driver.p0.link(mc.get_port(name))
+            driver.p0.write(val)
+        b.run(cycles=cycles)
+        regs = [r.read() for n, r in sorted(mc.registers.items())]
+        return regs, mc.p1.output, mc._cpu._inst_pointer
+
+    def test_matches_cpu(self):
+        rng = random.Random(4)
+        n = 40
+        for model, code in PROGRAMS:
+            for cycles in (1, 7, 50, 2500):
+                p0 = [rng.randint(0, 100) for _ in range(n)]
+                p1 = [rng.choice([0, 50, 100]) for _ in range(n)]
+                lanes = Lanes(model, code, n)
+                lanes.run(cycles, inputs={'p0': p0, 'p1': p1})
+                names = sorted(lanes._mc.registers)
+                for i in range(n):
+                    regs, out, ip = self.scalar(
+                        model, code, cycles, {'p0': p0[i], 'p1': p1[i]})
+                    self.assertEqual(
+                        (regs, out, ip),
+                        ([int(lanes.register(r)[i]) for r in names],
+                         int(lanes.output('p1')[i]),
+                         int(lanes.inst_pointer[i])),
+                        "{} lane {} after {} cycles".format(code, i, cycles)
+                    )
+
+    def test_per_cycle_inputs(self):
+        code = "add p0"
+        inputs = np.array([[1, 2, 3], [10, 20, 30]])
+        lanes = Lanes(MC4000, code, 2)
+        lanes.run(3, inputs={'p0': inputs})
+        self.assertEqual([6, 60], list(lanes.acc))
+
+    def test_xbus_unsupported(self):
+        with self.assertRaises(x.CommandException):
+            Lanes(MC6000, "mov x0 acc", 4)
@@ -77,3 +77,17 @@ class MicrocontrollerTestCase(unittest.TestCase):
         mc1.p0.write(100)
         self.assertEqual(0, mc1.p0.read())
         self.assertEqual(0, mc2.p1.read())
+
+    def test_compact_layout(self):
+        mc1 = MC6000()
+        mc2 = MC6000()
+        mc1.p0.link(mc2.p0)
+        for obj in (mc1, mc1._cpu, mc1.p0, mc1.x0, mc1.p0._circuit,
+                    mc1.register('acc'), mc1.register('null')):
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+        self.assertIs(mc1._layout, mc2._layout)
+        self.assertIs(mc1.dat, mc1.register('dat0'))
+        self.assertEqual(['acc', 'null', 'dat0', 'dat'],
+                         list(mc1.registers))
+        with self.assertRaises(AttributeError):
+            mc1.foo = 1
@@ -0,0 +1,67 @@
+import unittest
+
+from mcx4.board import Board
+from mcx4.microcontrollers import MC6000
+from mcx4.profiler import Profiler
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.board = Board()
+        self.writer = MC6000('writer')
+        self.reader = MC6000('reader')
+        self.board.add(self.writer)
+        self.board.add(self.reader)
+        self.writer.x0.link(self.reader.x0)
+        self.writer.compile("""
+            add 1
+            teq acc 5
+          + slp 1
+            mov acc x0
+        """)
+        self.reader.compile("""
+            mov x0 dat  ; Take a value.
+            add dat
+        """)
+        self.profiler = Profiler(self.board)
+
+    def test_lines(self):
+        self.profiler.start()
+        self.board.run(cycles=5000)
+        self.profiler.stop()
+        lines = self.profiler.lines(self.writer)
+        self.assertEqual(
+            [2, 3, 4, 5], [number for number, *rest in lines])
+        self.assertEqual('+ slp 1', lines[2][1])
+        self.assertEqual((800, 1, 799), lines[2][2:])
+        self.assertEqual((0, 0), lines[0][3:])
+        self.assertEqual(
+            'mov x0 dat  ; Take a value.', self.profiler.lines(self.reader)[0][1])
+
+    def test_states(self):
+        self.profiler.start()
+        self.board.run(cycles=5000)
+        for mc in (self.writer, self.reader):
+            self.assertEqual(5000, sum(self.profiler.states(mc).values()))
+        self.assertEqual(
+            {'executing': 3200, 'sleeping': 1000, 'blocked': 800},
+            self.profiler.states(self.writer))
+        self.assertEqual(0, self.profiler.states(self.reader)['sleeping'])
+
+    def test_stop(self):
+        step = self.writer._cpu._stepper
+        self.profiler.start()
+        self.assertNotEqual(step, self.writer._cpu._stepper)
+        self.profiler.stop()
+        self.assertEqual(step, self.writer._cpu._stepper)
+        self.assertEqual([step, self.reader._cpu.step], self.board._steppers)
+        self.board.run(cycles=100)
+        self.assertEqual({}, self.profiler.profiles[self.writer].counts)
+
+    def test_report(self):
+        self.profiler.start()
+        self.board.run(cycles=100)
+        report = self.profiler.report()
+        self.assertIn("add dat", report)
+        self.assertIn("+ slp 1  (taken 1, skipped 4)", report)
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+
+from mcx4.board import Board
+from mcx4.microcontrollers import MC6000
+from mcx4.realtime import RealtimeRunner
+
+
+class RealtimeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.board = Board()
+        self.mc1 = MC6000('mc1')
+        self.mc2 = MC6000('mc2')
+        self.board.add(self.mc1)
+        self.board.add(self.mc2)
+        self.mc1.p0.link(self.mc2.p0)
+        self.mc1.p1.link(self.mc2.p1)
+        self.mc2.compile("""
+            mov p0 acc
+            mul 2
+            mov acc p1
+            slp 1
+        """)
+        self.mc1.compile("slp 10")
+
+    def test_paced(self):
+        runner = RealtimeRunner(self.board, seconds_per_ATU=0.05)
+        start = time.monotonic()
+        cycles = asyncio.run(runner.run(atus=3))
+        elapsed = time.monotonic() - start
+        self.assertEqual(3000, cycles)
+        self.assertGreaterEqual(elapsed, 0.14)
+        self.assertLess(elapsed, 2)
+        self.assertEqual(200, runner.burst())  # 10ms of simulated time.
+
+    def test_inputs_and_outputs(self):
+        runner = RealtimeRunner(self.board, seconds_per_ATU=0.02)
+
+        async def drive():
+            task = asyncio.ensure_future(runner.run())
+            await runner.write(self.mc1.p0, 21)
+            value = await runner.wait_for(self.mc1.p1, lambda v: v > 0, 5)
+            runner.stop()
+            await task
+            return value
+
+        self.assertEqual(42, asyncio.run(drive()))
+        self.assertFalse(runner.running)
+        self.assertEqual(0, self.mc1.p1.output)  # Nothing was read.
+
+    def test_wait_timeout(self):
+        runner = RealtimeRunner(self.board, seconds_per_ATU=0.02)
+
+        async def wait():
+            task = asyncio.ensure_future(runner.run())
+            try:
+                await runner.wait_for(self.mc1.p1, lambda v: v > 0, 0.1)
+            finally:
+                runner.stop()
+                await task
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(wait())
+        self.assertEqual([], runner._waiters)
@@ -0,0 +1,172 @@
+import unittest
+
+from mcx4.board import Board
+from mcx4.exceptions import PortCompatException
+from mcx4.microcontrollers import MC6000
+from mcx4.stimulus import Stimulus
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional.
+    np = None
+
+
+class StimulusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.board = Board()
+        self.mc = MC6000('mc')
+        self.board.add(self.mc)
+        self.mc.compile("mov p0 acc")
+        self.start = self.board.clock.get()
+
+    def stimulus(self, source, **kwargs):
+        stim = Stimulus(self.board, source, **kwargs)
+        stim.link(self.mc.p0)
+        stim.start()
+        return stim
+
+    def seen(self, cycles):
+        """
+        acc after each cycle.
+        """
+        out = []
+        for n in range(cycles):
+            self.board.step()
+            out.append(self.mc.register('acc').read())
+        return out
+
+    def test_list(self):
+        self.stimulus([10, 10, 20, 30, 30])
+        self.assertEqual([10, 10, 20, 30, 30, 30, 30], self.seen(7))
+
+    def test_no_hold(self):
+        self.stimulus([10, 20], hold=False)
+        self.assertEqual([10, 20, 0, 0], self.seen(4))
+
+    def test_loop(self):
+        self.stimulus([10, 20, 20], loop=True)
+        self.assertEqual([10, 20, 20, 10, 20, 20, 10], self.seen(7))
+
+    def test_loop_iterator(self):
+        self.stimulus(iter([10, 20, 20]), loop=True)
+        self.assertEqual([10, 20, 20, 10, 20, 20, 10], self.seen(7))
+
+    def test_loop_constant(self):
+        stim = self.stimulus(iter([50, 50]), loop=True)
+        self.assertEqual([50] * 5, self.seen(5))
+        self.assertEqual([], self.board._drivers)
+        self.assertEqual(50, stim.read())
+
+    def test_loop_constant_no_hold(self):
+        for source in ([50, 50, 50], iter([50, 50, 50])):
+            self.setUp()
+            self.stimulus(source, loop=True, hold=False)
+            self.assertEqual([50] * 6, self.seen(6))
+
+    def test_generator_is_lazy(self):
+        taken = []
+
+        def samples():
+            for n in range(10 ** 9):
+                taken.append(n)
+                yield n % 100
+
+        self.stimulus(samples())
+        self.assertEqual([0, 1, 2], self.seen(3))
+        self.assertLess(len(taken), 10)
+
+    def test_period(self):
+        self.stimulus([10, 20], period=2)
+        self.assertEqual([10, 10, 20, 20, 20], self.seen(5))
+
+    def test_atus(self):
+        self.mc.compile("""
+            mov p0 acc
+            slp 1
+        """)
+        per_atu = self.board.clock.cycles_per_ATU
+        stim = self.stimulus([10, 20, 30], atus=True)
+        changes = []
+        stim.subscribe(lambda cycle, value: changes.append((cycle, value)))
+        self.board.run(atus=3)
+        self.assertEqual([
+            (self.start, 10), (self.start + per_atu, 20),
+            (self.start + 2 * per_atu, 30),
+        ], changes)
+        self.assertEqual(30, self.mc.register('acc').read())
+
+    def test_start_later(self):
+        stim = Stimulus(self.board, [10])
+        stim.link(self.mc.p0)
+        stim.start(self.start + 2)
+        self.assertEqual([0, 0, 10], self.seen(3))
+
+    def test_stop(self):
+        stim = self.stimulus([10, 20, 30])
+        self.seen(2)
+        stim.stop()
+        self.assertEqual([20, 20], self.seen(2))
+
+    def test_clamped(self):
+        self.stimulus([-5, 500])
+        self.assertEqual([0, 100], self.seen(2))
+
+    def test_run_matches_step(self):
+        samples = [0, 0, 40, 40, 40, 90, 10, 10, 0, 100]
+        totals = []
+        for stepped in (True, False):
+            self.setUp()
+            self.stimulus(samples)
+            self.mc.compile("""
+                mov p0 acc
+                mov acc p1
+            """)
+            other = MC6000('other')
+            self.board.add(other)
+            other.compile("add p1")
+            other.p1.link(self.mc.p1)
+            if stepped:
+                self.seen(len(samples))
+            else:
+                self.board.run(cycles=len(samples))
+            totals.append(other.register('acc').read())
+        self.assertEqual(totals[0], totals[1])
+        self.assertEqual(180, totals[1])
+
+    def test_sleepers_keep_time(self):
+        # Firing a Stimulus while everyone sleeps doesn't change when
+        # they wake.
+        results = []
+        for driven in (False, True):
+            self.setUp()
+            self.mc.compile("""
+                add 1
+                slp 1
+            """)
+            if driven:
+                self.stimulus([0, 0, 5, 0] * 3000, loop=True)
+            self.board.run(cycles=10000)
+            results.append((self.board.clock.get(),
+                            self.mc.register('acc').read(),
+                            self.mc._cpu._executed))
+        self.assertEqual(results[0], results[1])
+
+    def test_gpio_only(self):
+        stim = Stimulus(self.board, [10])
+        with self.assertRaises(PortCompatException):
+            stim.link(self.mc.x0)
+
+    @unittest.skipIf(np is None, "NumPy isn't installed.")
+    def test_array(self):
+        samples = np.zeros(10 ** 6, dtype=np.int32)
+        samples[1000:] = 50
+        samples[-1000:] = 70
+        stim = self.stimulus(samples)
+        changes = []
+        stim.subscribe(lambda cycle, value: changes.append((cycle, value)))
+        self.mc.compile("slp 1")
+        self.board.run(cycles=len(samples))
+        self.assertEqual([
+            (self.start + 1000, 50), (self.start + len(samples) - 1000, 70),
+        ], changes)
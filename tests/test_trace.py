@@ -0,0 +1,88 @@
+import unittest
+
+from mcx4.board import Board
+from mcx4.microcontrollers import MC6000
+
+try:
+    import numpy as np
+    from mcx4.trace import TraceRecorder, IDLE
+except ImportError:  # NumPy is optional.
+    np = None
+
+
+@unittest.skipIf(np is None, "NumPy isn't installed.")
+class TraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.board = Board()
+        self.mc1 = MC6000('mc1')
+        self.mc2 = MC6000('mc2')
+        self.board.add(self.mc1)
+        self.board.add(self.mc2)
+        self.mc1.p0.link(self.mc2.p0)
+        self.mc1.compile("""
+            mov 100 p0
+            mov 0 p0
+            nop
+        """)
+        self.mc2.compile("nop")
+        self.start = self.board.clock.get()
+
+    def test_value(self):
+        rec = TraceRecorder(self.board, [self.mc1.p0])
+        rec.start()
+        self.board.run(cycles=30)
+        t = self.start
+        self.assertEqual(0, rec.value(self.mc1.p0, t))
+        self.assertEqual(100, rec.value('mc1.p0', t + 1))
+        self.assertEqual(0, rec.value('mc1.p0', t + 2))
+        self.assertEqual(0, rec.value('mc1.p0', t + 3))
+        self.assertEqual(100, rec.value('mc1.p0', t + 4))
+        with self.assertRaises(ValueError):
+            rec.value('mc1.p0', t - 1)
+        with self.assertRaises(ValueError):
+            rec.value('mc1.p1', t)
+
+    def test_edges(self):
+        rec = TraceRecorder(self.board, [self.mc1.p0])
+        rec.start()
+        self.board.run(cycles=30)
+        times, values = rec.edges('mc1.p0', 0, self.start + 7)
+        t = self.start
+        self.assertEqual([t + 1, t + 2, t + 4, t + 5], list(times))
+        self.assertEqual([100, 0, 100, 0], list(values))
+
+    def test_bounded(self):
+        rec = TraceRecorder(self.board, [self.mc1.p0], capacity=8)
+        rec.start()
+        self.board.run(cycles=3000)
+        times, values = rec.changes('mc1.p0')
+        self.assertEqual(8, len(times))
+        self.assertEqual(self.start + 2999, times[-1])
+        self.assertEqual(sorted(times), list(times))
+        self.assertEqual(0, rec.value('mc1.p0', self.start + 3000))
+        with self.assertRaises(ValueError):
+            rec.value('mc1.p0', self.start + 100)  # Dropped.
+
+    def test_no_side_effects(self):
+        rec = TraceRecorder(self.board, [self.mc1.p0, self.mc2.p0])
+        rec.start()
+        self.board.step()
+        self.assertEqual(100, self.mc1.p0.output)
+        self.assertEqual(100, self.mc2.p0.read())
+        rec.stop()
+        self.board.run(cycles=10)
+        self.assertEqual(2, len(rec.changes(self.mc1.p0)[0]))
+
+    def test_xbus(self):
+        self.mc1.x0.link(self.mc2.x0)
+        self.mc1.compile("mov 5 x0")
+        self.mc2.compile("""
+            slp 1
+            mov x0 acc
+        """)
+        rec = TraceRecorder(self.board, [self.mc1.x0])
+        rec.start()
+        self.board.run(cycles=5000)
+        times, values = rec.changes(self.mc1.x0)
+        self.assertEqual([IDLE, 5, IDLE, 5], list(values[:4]))
@@ -0,0 +1,186 @@
+import random
+import unittest
+
+from mcx4 import vectors
+from mcx4.batch import BoardSpec
+from mcx4.board import Board
+from mcx4.microcontrollers import MC4000, MC6000
+from mcx4.stimulus import Stimulus
+
+
+DOUBLER = """
+  mov p0 acc
+  mul 2
+  mov acc p1
+"""
+
+PULSE = """
+  teq p0 0
++ slp 1
+  mov 100 p1
+  mov 0 p1
+"""
+
+
+class VectorsTestCase(unittest.TestCase):
+
+    def board(self):
+        board = Board()
+        a = MC6000('a')
+        b = MC4000('b')
+        board.add(a)
+        board.add(b)
+        a.compile(DOUBLER)
+        b.compile(PULSE)
+        a.p1.link(b.p0)
+        return board, a, b
+
+    def reference(self, samples, cycles):
+        """
+        b.p1 after each cycle, and where everyone was, one step at a time.
+        """
+        board, a, b = self.board()
+        stim = Stimulus(board, samples)
+        stim.link(a.p0)
+        stim.start()
+        b.p1.subscribe(lambda cycle, value: None)  # Gives it a circuit.
+        trace = []
+        pointers = []
+        for n in range(cycles):
+            board.step()
+            trace.append(b.p1._circuit._value)
+            pointers.append({'a': a._cpu._inst_pointer,
+                             'b': b._cpu._inst_pointer})
+        return trace, pointers
+
+    def samples(self, rand, cycles):
+        out = []
+        while len(out) < cycles:
+            out += [rand.choice((0, 0, 10, 40, 60))] * rand.randint(1, 2500)
+        return out[:cycles]
+
+    def test_pass(self):
+        samples = [0] * 10 + [30] * 3000
+        trace, pointers = self.reference(samples, len(samples))
+        self.assertIn(100, trace)
+        board, a, b = self.board()
+        result = vectors.check(board, {'a.p0': samples}, {'b.p1': trace})
+        self.assertTrue(result.passed, result)
+        self.assertEqual(len(samples), result.cycles)
+        self.assertIsNone(result.pointers)
+
+    def test_first_difference(self):
+        rand = random.Random(4)
+        cycles = 6000
+        for n in range(8):
+            samples = self.samples(rand, cycles)
+            trace, pointers = self.reference(samples, cycles)
+            k = rand.choice((0, cycles - 1, rand.randrange(cycles)))
+            expected = list(trace)
+            expected[k] = 100 - trace[k]
+            board, a, b = self.board()
+            result = vectors.check(
+                board, {a.p0: samples}, {'b.p1': expected})
+            self.assertFalse(result.passed)
+            self.assertEqual(k, result.cycle)
+            self.assertEqual('b.p1', result.port)
+            self.assertEqual(expected[k], result.expected)
+            self.assertEqual(trace[k], result.actual)
+            self.assertEqual(pointers[k], result.pointers)
+            # Stopped right after the difference.
+            self.assertEqual(k + 1, result.cycles)
+
+    def test_everyone_asleep(self):
+        rand = random.Random(9)
+        cycles = 20000
+        code = """
+            mov p0 acc
+            mul 2
+            mov acc p1
+            slp 1
+        """
+        for n in range(4):
+            samples = self.samples(rand, cycles)
+            board = Board()
+            a = MC6000('a')
+            board.add(a)
+            a.compile(code)
+            stim = Stimulus(board, samples)
+            stim.link(a.p0)
+            start = board.clock.get()
+            stim.start()
+            changes = []
+            a.p1.subscribe(lambda cycle, value: changes.append(
+                (cycle - start, value)))
+            board.run(cycles=cycles)
+            trace = [0] * cycles
+            for cycle, value in changes:
+                trace[cycle:] = [value] * (cycles - cycle)
+            k = changes[-1][0] if n % 2 else rand.randrange(cycles)
+            expected = list(trace)
+            expected[k] += 1
+            board = Board()
+            a = MC6000('a')
+            board.add(a)
+            a.compile(code)
+            result = vectors.check(board, {'a.p0': samples}, {'a.p1': trace})
+            self.assertTrue(result.passed, result)
+            board = Board()
+            a = MC6000('a')
+            board.add(a)
+            a.compile(code)
+            result = vectors.check(
+                board, {'a.p0': samples}, {'a.p1': expected})
+            self.assertEqual(k, result.cycle)
+            self.assertEqual(k + 1, result.cycles)
+
+    def test_earliest_output(self):
+        samples = [0] * 5 + [50] * 20
+        board, a, b = self.board()
+        result = vectors.check(board, {'a.p0': samples}, {
+            'b.p1': [0] * 25,
+            'a.p1': [0] * 25,
+        })
+        self.assertEqual('a.p1', result.port)
+        self.assertEqual(8, result.cycle)
+        self.assertEqual((0, 100), (result.expected, result.actual))
+
+    def test_cleans_up(self):
+        board, a, b = self.board()
+        vectors.check(board, {'a.p0': [10, 20]}, {'a.p1': [0, 0, 0]})
+        self.assertEqual([], board._drivers)
+        self.assertEqual([a.p0], a.p0._circuit._attached)
+        self.assertIsNone(a.p1._circuit._subscribers)
+
+    def test_iterators(self):
+        board, a, b = self.board()
+        with self.assertRaises(TypeError):
+            vectors.check(board, {}, {'a.p1': iter([0, 0])})
+        self.assertEqual([], board._drivers)
+        result = vectors.check(board, {'a.p0': iter([10] * 20)},
+                               {'a.p1': iter([0, 0, 20, 20])}, cycles=4)
+        self.assertTrue(result.passed, result)
+        self.assertEqual(4, result.cycles)
+
+    def test_xbus(self):
+        board, a, b = self.board()
+        with self.assertRaises(TypeError):
+            vectors.check(board, {}, {'a.x0': [0]})
+
+    def test_check_many(self):
+        spec = BoardSpec(
+            controllers={'a': ('MC6000', DOUBLER)},
+            links=[],
+        )
+        cases = [
+            ({'a.p0': [n] * 10}, {'a.p1': [0, 0] + [min(2 * n, 100)] * 8})
+            for n in range(20)
+        ]
+        results = vectors.check_many(spec, cases, workers=2)
+        self.assertEqual(20, len(results))
+        self.assertTrue(all(r.passed for r in results))
+        cases[7][1]['a.p1'][5] = 1
+        results = vectors.check_many(spec, cases, workers=2, shards=4)
+        self.assertEqual(8, len(results))
+        self.assertTrue(all(r.passed for r in results[:7]))
+        self.assertEqual(5, results[7].cycle)
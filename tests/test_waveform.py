@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mcx4.board import Board
+from mcx4.microcontrollers import MC6000
+from mcx4.waveform import VCDSink, BinarySink, load, IDLE
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional.
+    np = None
+
+
+class WaveformTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.board = Board()
+        self.mc1 = MC6000('mc1')
+        self.mc2 = MC6000('mc2')
+        self.board.add(self.mc1)
+        self.board.add(self.mc2)
+        self.mc1.x0.link(self.mc2.x0)
+        self.mc1.compile("""
+            mov 100 p0
+            mov -5 acc
+            mov 0 p0
+            mov acc x0
+        """)
+        self.mc2.compile("mov x0 dat")
+        self.signals = [
+            self.mc1.p0, self.mc1.register('acc'), self.mc1.x0,
+        ]
+        self.start = self.board.clock.get()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_vcd(self):
+        path = os.path.join(self.dir, 'run.vcd')
+        with VCDSink(self.board, path, self.signals, batch=2):
+            self.board.run(cycles=5)
+        with open(path) as f:
+            vcd = f.read().split('\n')
+        self.assertIn("$scope module mc1 $end", vcd)
+        self.assertIn("$var integer 11 ! p0 $end", vcd)
+        self.assertIn('$var integer 11 " acc $end', vcd)
+        body = vcd[vcd.index("$enddefinitions $end") + 1:]
+        t = self.start
+        self.assertEqual([
+            "#{}".format(t), "b0 !", 'b0 "', "b{:b} #".format(IDLE & 0x7ff),
+            "#{}".format(t + 1), "b1100100 !",
+            "#{}".format(t + 2), 'b11111111011 "',
+            "#{}".format(t + 3), "b0 !",
+            "#{}".format(t + 4), "b11111111011 #",
+            "#{}".format(t + 5), "b{:b} #".format(IDLE & 0x7ff),
+            "",
+        ], body)
+
+    @unittest.skipIf(np is None, "NumPy isn't installed.")
+    def test_binary(self):
+        path = os.path.join(self.dir, 'run.wave')
+        sink = BinarySink(self.board, path, self.signals, batch=3)
+        sink.start()
+        self.board.run(cycles=4000)
+        sink.stop()
+        names, records = load(path)
+        self.assertEqual(['mc1.p0', 'mc1.acc', 'mc1.x0'], names)
+        t = self.start
+        self.assertEqual(
+            [(t, 0, 0), (t, 1, 0), (t, 2, IDLE), (t + 1, 0, 100)],
+            records[:4].tolist())
+        p0 = records[records['signal'] == 0]
+        # Five cycle loop, with one cycle waiting for mc2 to read x0.
+        self.assertEqual(1 + 2 * 800, len(p0))
+        self.assertTrue((np.diff(records['time']) >= 0).all())
+
+    @unittest.skipIf(np is None, "NumPy isn't installed.")
+    def test_binary_grows(self):
+        path = os.path.join(self.dir, 'run.wave')
+        sink = BinarySink(self.board, path, self.signals)
+        sink._grow = 64
+        with sink:
+            self.board.run(cycles=1000)
+        names, records = load(path)
+        # Starting values, acc once, then p0 and x0 twice a loop.
+        self.assertEqual(3 + 1 + 4 * 200, len(records))